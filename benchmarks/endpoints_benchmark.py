@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+
+"""endpoints_benchmark.py
+
+Benchmark every ConferenceApi endpoint on the local App Engine testbed.
+
+For each dataset size the script seeds that many conferences, sessions and
+profiles into the datastore stub, calls every ConferenceApi method directly
+and records latency percentiles, RPCs per call (by service) and datastore
+entities read and written per call. The results go to a JSON file so that
+two runs, e.g. of two releases, can be compared; --baseline prints every
+endpoint's p50 latency and RPCs per call next to those of an earlier run.
+
+    python benchmarks/endpoints_benchmark.py \
+        --sdk ~/google-cloud-sdk/platform/google_appengine \
+        --sizes 1000,10000,100000 --output bench_results.json \
+        --baseline bench_results_before.json
+
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import date
+from datetime import datetime
+from datetime import time as time_of_day
+
+from benchutil import activate_testbed
+from benchutil import login
+from benchutil import RpcCounter
+from benchutil import setup_sdk
+
+BENCH_USER = 'bench@example.com'
+SEED_BATCH_SIZE = 500
+SESSIONS_PER_CONFERENCE = 100
+SPEAKERS_PER_CONFERENCE = 10
+ATTENDING = 20
+WISHLISTED = 20
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def put_in_batches(entities):
+    from google.appengine.ext import ndb
+    for i in range(0, len(entities), SEED_BATCH_SIZE):
+        ndb.put_multi(entities[i:i + SEED_BATCH_SIZE])
+
+
+def seed(size):
+    """Seed `size` profiles, conferences and sessions; return the keys the
+    benchmark cases need.
+    """
+    from google.appengine.ext import ndb
+    import models
+    import search_index
+
+    rnd = random.Random(size)
+    cities = ['London', 'Paris', 'Berlin', 'Tokyo', 'Chicago']
+    topics = ['Medical Innovations', 'Web', 'Cloud', 'Mobile', 'Security']
+
+    # the benchmark user organizes the conferences holding sessions
+    p_keys = [ndb.Key(models.Profile, BENCH_USER)] + [
+        ndb.Key(models.Profile, 'user%d@example.com' % i)
+        for i in range(size - 1)]
+    session_confs = max(1, size // SESSIONS_PER_CONFERENCE)
+    c_keys = []
+    conferences = []
+    for i in range(size):
+        p_key = p_keys[0] if i < session_confs else rnd.choice(p_keys)
+        c_key = ndb.Key(models.Conference, i + 1, parent=p_key)
+        month = rnd.randint(1, 12)
+        max_attendees = rnd.choice([10, 50, 100, 500])
+        conferences.append(models.Conference(
+            key=c_key, name='Conference %06d' % i,
+            description='Seeded conference', organizerUserId=p_key.id(),
+            organizerDisplayName=p_key.id().split('@')[0],
+            topics=rnd.sample(topics, 2), city=rnd.choice(cities),
+            startDate=date(2016, month, 1), month=month,
+            endDate=date(2016, month, 3), maxAttendees=max_attendees,
+            seatsAvailable=rnd.randint(1, max_attendees)))
+        c_keys.append(c_key)
+    put_in_batches(conferences)
+
+    speakers = [models.Speaker(name='Speaker %d' % i) for i in range(
+        session_confs * SPEAKERS_PER_CONFERENCE)]
+    sp_keys = ndb.put_multi(speakers)
+
+    sessions = []
+    for i in range(size):
+        c_key = c_keys[i % session_confs]
+        sessions.append(models.Session(
+            key=ndb.Key(models.Session, i + 1, parent=c_key),
+            name='Session %06d' % i, highlights='Seeded session',
+            speakerKey=rnd.choice(sp_keys).urlsafe(),
+            duration=rnd.choice([30, 60, 90]),
+            typeOfSession=rnd.choice(['Workshop', 'Lecture', 'Talk']),
+            date=date(2016, 6, rnd.randint(1, 3)),
+            # some sessions have no start time, range filters skip them
+            startTime=(time_of_day(rnd.randint(8, 21), 0) if i % 5
+                       else None),
+            parentConference=c_key.urlsafe()))
+    s_keys = [sess.key for sess in sessions]
+    put_in_batches(sessions)
+    # the speaker indexes createSession(s) maintains
+    put_in_batches([models.SpeakerSession(
+        key=ndb.Key(models.SpeakerSession, sess.key.id(),
+                    parent=sess.key.parent()),
+        speaker=ndb.Key(urlsafe=sess.speakerKey)) for sess in sessions])
+    counts = {}
+    for sess in sessions:
+        counts.setdefault((sess.key.parent(), sess.speakerKey),
+                          []).append(sess.name)
+    put_in_batches([models.SpeakerSessionCount(
+        key=ndb.Key(models.SpeakerSessionCount, speaker, parent=c_key),
+        count=len(names), sessionNames=names)
+        for (c_key, speaker), names in counts.items()])
+
+    profiles = []
+    for p_key in p_keys:
+        profiles.append(models.Profile(
+            key=p_key, displayName=p_key.id().split('@')[0],
+            mainEmail=p_key.id(), teeShirtSize='NOT_SPECIFIED'))
+    put_in_batches(profiles)
+    put_in_batches([models.Registration(
+        key=ndb.Key(models.Registration, c_key.urlsafe(), parent=p_keys[0]),
+        conferenceKey=c_key) for c_key in c_keys[:ATTENDING]])
+    put_in_batches([models.WishlistEntry(
+        key=ndb.Key(models.WishlistEntry, s_key.urlsafe(), parent=p_keys[0]),
+        conferenceKey=s_key.parent()) for s_key in s_keys[:WISHLISTED]])
+    search_index.update(c_keys + s_keys)
+
+    return {'conferences': c_keys, 'sessions': s_keys, 'speakers': sp_keys,
+            'session_conferences': c_keys[:session_confs]}
+
+
+def build_cases(data):
+    """Return (endpoint name, call(i)) pairs, one per ConferenceApi method.
+
+    Cases run in this order, so stateful ones can rely on earlier ones,
+    e.g. unregisterFromConference undoes registerForConference.
+    """
+    import conference as api_module
+    from conference import ConferenceApi
+    import models
+    from protorpc import message_types
+
+    api = ConferenceApi()
+    hot = data['session_conferences'][0].urlsafe()
+    sessions = data['sessions']
+    # conferences the benchmark user is not attending yet
+    free = data['conferences'][ATTENDING:] or data['conferences']
+
+    def conf_request(wsck):
+        return api_module.CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck)
+
+    def read_request(wsck, etag=None):
+        return api_module.CONF_READ_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck, ifNoneMatch=etag)
+
+    def attending_request(etag=None):
+        return api_module.ATTENDING_GET_REQUEST.combined_message_class(
+            ifNoneMatch=etag)
+
+    # ETags of the polled resources, for the conditional reads
+    etags = {}
+
+    def poll(name, call, make_request):
+        if name not in etags:
+            etags[name] = call(make_request(None)).etag
+        return call(make_request(etags[name]))
+
+    def wishlist_request(i):
+        return api_module.WISHLIST_POST_REQUEST.combined_message_class(
+            websafeSessionKey=sessions[-(i % len(sessions)) - 1].urlsafe())
+
+    def query(i):
+        filters = [models.ConferenceQueryForm(
+            field='CITY', operator='EQ', value='London')]
+        if i % 2:
+            filters.append(models.ConferenceQueryForm(
+                field='MONTH', operator='EQ', value='6'))
+        return models.ConferenceQueryForms(filters=filters)
+
+    def new_conference(i):
+        return models.ConferenceForm(
+            name='Benchmark %d' % i, city='London', topics=['Web'],
+            startDate='2016-06-01', endDate='2016-06-02', maxAttendees=100)
+
+    def new_session(i):
+        return models.SessionForm(
+            name='Benchmark session %d' % i, date='2016-06-01',
+            startTime='10:00', duration=60,
+            speakerKey=data['speakers'][i % len(data['speakers'])].urlsafe(),
+            parentConference=hot)
+
+    void = message_types.VoidMessage()
+    tickets = []
+    jobs = []
+
+    def import_conferences(i):
+        rows = [{'name': 'Imported %d-%d' % (i, j), 'city': 'Paris',
+                 'topics': ['Web'], 'startDate': '2016-07-01',
+                 'maxAttendees': 100} for j in range(10)]
+        job = api.import_conferences(models.ConferenceImportForm(
+            payload=json.dumps(rows), format='json'))
+        jobs.append(job.jobId)
+
+    def request_registration(i):
+        ticket = api.request_conference_registration(
+            conf_request(free[-(i % len(free)) - 1].urlsafe()))
+        tickets.append(ticket.ticketId)
+
+    return [
+        ('getProfile', lambda i: api.get_profile(void)),
+        ('saveProfile', lambda i: api.save_profile(models.ProfileMiniForm(
+            teeShirtSize=models.TeeShirtSize.M_M))),
+        ('getConference', lambda i: api.get_conference(
+            read_request(data['conferences'][
+                i % len(data['conferences'])].urlsafe()))),
+        ('getConference (If-None-Match)', lambda i: poll(
+            'conference', api.get_conference,
+            lambda etag: read_request(hot, etag))),
+        ('getConferencesCreated',
+         lambda i: api.get_conferences_created(void)),
+        ('queryConferences', lambda i: api.query_conferences(query(i))),
+        ('getConferencesWithOpenSlots',
+         lambda i: api.get_conferences_with_open_slots(void)),
+        ('getConferencesToAttend',
+         lambda i: api.get_conferences_to_attend(attending_request())),
+        ('getConferencesToAttend (If-None-Match)', lambda i: poll(
+            'attending', api.get_conferences_to_attend, attending_request)),
+        ('getConferenceRoster', lambda i: api.get_conference_roster(
+            api_module.ROSTER_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=hot))),
+        ('filterPlayground', lambda i: api.filter_playground(void)),
+        ('getSessions', lambda i: api.get_sessions(read_request(hot))),
+        ('getSessions (If-None-Match)', lambda i: poll(
+            'sessions', api.get_sessions,
+            lambda etag: read_request(hot, etag))),
+        ('getSessionsByType', lambda i: api.get_sessions_by_type(
+            api_module.SESS_BY_TYPE_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=hot, typeOfSession='Workshop'))),
+        ('querySessions', lambda i: api.query_sessions(
+            models.SessionQueryForms(websafeConferenceKey=hot, filters=[
+                models.SessionQueryForm(field='DATE', operator='EQ',
+                                        value='2016-06-01'),
+                models.SessionQueryForm(field='TYPE', operator='NE',
+                                        value='Workshop'),
+                models.SessionQueryForm(field='START_TIME', operator='LT',
+                                        value='19:00')]))),
+        ('getSessionsByDate', lambda i: api.get_sessions_by_date(
+            api_module.SESS_BY_DATE_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=hot, date='2016-06-01'))),
+        ('getSessionsBySpeaker', lambda i: api.get_sessions_by_speaker(
+            api_module.SPEAKER_GET_REQUEST.combined_message_class(
+                speakerKey=data['speakers'][0].urlsafe()))),
+        ('getSpeakersByConference',
+         lambda i: api.get_speakers_by_conference(
+             api_module.SPEAKER_BY_CONFERENCE_GET_REQUEST.
+             combined_message_class(websafeConferenceKey=hot))),
+        ('searchConferences', lambda i: api.search_conferences(
+            models.SearchForm(query='Conference London'))),
+        ('searchSessions', lambda i: api.search_sessions(
+            models.SearchForm(query='Workshop', websafeConferenceKey=hot))),
+        ('getSessionsInWishList',
+         lambda i: api.get_sessions_in_wishlist(
+             api_module.WISHLIST_GET_REQUEST.combined_message_class())),
+        ('addSessionToWishList',
+         lambda i: api.add_session_to_wishlist(wishlist_request(i))),
+        ('removeSessionFromWishList',
+         lambda i: api.remove_session_from_wishlist(wishlist_request(i))),
+        ('createConference',
+         lambda i: api.create_conference(new_conference(i))),
+        ('updateConference', lambda i: api.update_conference(
+            api_module.CONF_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=hot, description='Updated %d' % i))),
+        ('importConferences', import_conferences),
+        ('getImportJob', lambda i: api.get_import_job(
+            api_module.IMPORT_JOB_GET_REQUEST.combined_message_class(
+                jobId=jobs[i % len(jobs)]))),
+        ('createSpeakerObject', lambda i: api.create_speaker(
+            models.SpeakerForm(name='Benchmark speaker %d' % i))),
+        ('createSession', lambda i: api.create_session(new_session(i))),
+        ('createSessions', lambda i: api.create_sessions(
+            api_module.SESSIONS_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=hot,
+                items=[new_session(i * 10 + j) for j in range(10)]))),
+        ('registerForConference', lambda i: api.register_for_conference(
+            conf_request(free[i % len(free)].urlsafe()))),
+        ('unregisterFromConference',
+         lambda i: api.unregister_from_conference(
+             conf_request(free[i % len(free)].urlsafe()))),
+        ('requestConferenceRegistration', request_registration),
+        ('getRegistrationStatus', lambda i: api.get_registration_status(
+            api_module.TICKET_GET_REQUEST.combined_message_class(
+                ticketId=tickets[i % len(tickets)]))),
+        ('getAnnouncement', lambda i: api.get_announcement(void)),
+        ('getDashboard', lambda i: api.get_dashboard(void)),
+        ('getFeaturedSpeaker', lambda i: api.get_featured_speaker(
+            api_module.FEATURED_SPEAKER_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=hot))),
+    ]
+
+
+def run_size(size, iterations, cold):
+    """Seed one dataset and benchmark every endpoint against it."""
+    from google.appengine.api import memcache
+    from google.appengine.ext import ndb
+
+    bed = activate_testbed()
+    try:
+        login(BENCH_USER)
+        started = time.time()
+        data = seed(size)
+        print('seeded %d of each kind in %.1fs' % (size,
+                                                   time.time() - started))
+
+        counter = RpcCounter()
+        counter.install()
+        results = {}
+        for name, call in build_cases(data):
+            latencies = []
+            errors = []
+            counter.reset()
+            for i in range(iterations):
+                # every endpoint call starts with an empty context cache,
+                # like a fresh request would
+                ndb.get_context().clear_cache()
+                if cold:
+                    memcache.flush_all()
+                started = time.time()
+                try:
+                    call(i)
+                except Exception as e:
+                    errors.append('%s: %s' % (type(e).__name__, e))
+                latencies.append((time.time() - started) * 1000)
+            results[name] = {
+                'errors': len(errors),
+                'first_error': errors[0] if errors else None,
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p90_ms': round(percentile(latencies, 90), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'max_ms': round(max(latencies), 3),
+                'rpcs_per_call': dict(
+                    (service, float(count) / iterations)
+                    for service, count in counter.calls.items()),
+                'entities_read_per_call':
+                    float(counter.entities_read) / iterations,
+                'entities_written_per_call':
+                    float(counter.entities_written) / iterations,
+            }
+            print('  %-32s p50 %9.2fms  p99 %9.2fms  reads %8.1f' % (
+                name, results[name]['p50_ms'], results[name]['p99_ms'],
+                results[name]['entities_read_per_call']))
+        return results
+    finally:
+        bed.deactivate()
+
+
+def compare(baseline, report):
+    """Print each endpoint's p50 latency and RPCs per call before (the
+    baseline run) and after (this run).
+    """
+    for size in sorted(report['sizes'], key=int):
+        before = baseline['sizes'].get(size)
+        if not before:
+            continue
+        print('dataset size %s, before -> after' % size)
+        after = report['sizes'][size]
+        for name in sorted(set(before) & set(after)):
+            old, new = before[name], after[name]
+            print('  %-32s p50 %9.2fms -> %9.2fms  rpcs %5.1f -> %5.1f' % (
+                name, old['p50_ms'], new['p50_ms'],
+                sum(old['rpcs_per_call'].values()),
+                sum(new['rpcs_per_call'].values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark every ConferenceApi endpoint on the testbed.')
+    parser.add_argument('--sdk', help='path to the App Engine SDK')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated dataset sizes '
+                             '(default: 1000,10000,100000)')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='calls per endpoint (default: 50)')
+    parser.add_argument('--cold', action='store_true',
+                        help='flush memcache before every call')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='JSON results file (default: bench_results.json)')
+    parser.add_argument('--baseline',
+                        help='results file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    setup_sdk(args.sdk)
+    report = {'created': datetime.utcnow().isoformat(),
+              'iterations': args.iterations,
+              'cold': args.cold,
+              'sizes': {}}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        print('dataset size %d' % size)
+        report['sizes'][str(size)] = run_size(size, args.iterations,
+                                              args.cold)
+
+    with open(args.output, 'w') as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    print('results written to %s' % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(json.load(baseline), report)
+
+
+if __name__ == '__main__':
+    main()
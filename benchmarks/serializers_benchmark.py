@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""serializers_benchmark.py
+
+Micro-benchmark of the precompiled serializers in serializers.py against the
+all_fields() copy loops that ConferenceApi used before them.
+
+Run from the repository root with the App Engine SDK on the path, e.g.
+
+    python benchmarks/serializers_benchmark.py \
+        --sdk ~/google-cloud-sdk/platform/google_appengine --items 1000 \
+        --output serializer_results.json
+
+The timings are printed and, with --output, written to a JSON file so they
+can be kept next to the endpoint benchmark's results.
+
+"""
+
+import argparse
+import json
+import timeit
+from datetime import date
+from datetime import time
+
+from benchutil import setup_sdk
+
+
+# - - - - Copy loops as they were before serializers.py - - - - - - - -
+def legacy_conference_to_form(conf, form_type):
+    cf = form_type()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    cf.check_initialized()
+    return cf
+
+
+def legacy_session_to_form(sess, form_type, type_of_session):
+    sf = form_type()
+    for field in sf.all_fields():
+        if hasattr(sess, field.name):
+            if field.name == 'date' or field.name == "startTime":
+                setattr(sf, field.name, str(getattr(sess, field.name)))
+            elif field.name == "typeOfSession":
+                setattr(sf, field.name,
+                        getattr(type_of_session, getattr(sess, field.name)))
+            else:
+                setattr(sf, field.name, getattr(sess, field.name))
+        if field.name == "websafeSessionKey":
+            setattr(sf, field.name, sess.key.urlsafe())
+    sf.check_initialized()
+    return sf
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the precompiled model-to-form serializers.')
+    parser.add_argument('--sdk', help='path to the App Engine SDK')
+    parser.add_argument('--items', type=int, default=1000,
+                        help='entities per listing (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timing runs, the best one counts (default: 5)')
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    setup_sdk(args.sdk)
+    from google.appengine.ext import ndb
+    import models
+    import serializers
+
+    p_key = ndb.Key(models.Profile, 'organizer@example.com')
+    conferences = [
+        models.Conference(
+            key=ndb.Key(models.Conference, i + 1, parent=p_key),
+            name='Conference %d' % i, description='Description',
+            organizerUserId='organizer@example.com',
+            organizerDisplayName='Organizer', topics=['Web', 'Cloud'],
+            city='London', startDate=date(2016, 6, 1), month=6,
+            endDate=date(2016, 6, 3), maxAttendees=100, seatsAvailable=50)
+        for i in range(args.items)]
+    sessions = [
+        models.Session(
+            key=ndb.Key(models.Session, i + 1, parent=conferences[0].key),
+            name='Session %d' % i, highlights='Highlights',
+            speakerKey='speaker', duration=60, typeOfSession='Workshop',
+            date=date(2016, 6, 1), startTime=time(9, 30),
+            parentConference=conferences[0].key.urlsafe())
+        for i in range(args.items)]
+
+    cases = [
+        ('ConferenceForm',
+         lambda: [legacy_conference_to_form(c, models.ConferenceForm)
+                  for c in conferences],
+         lambda: serializers.to_forms(conferences, models.ConferenceForm)),
+        ('SessionForm',
+         lambda: [legacy_session_to_form(s, models.SessionForm,
+                                         models.TypeOfSession)
+                  for s in sessions],
+         lambda: serializers.to_forms(sessions, models.SessionForm)),
+    ]
+
+    results = {}
+    print('%-16s %12s %12s %8s' % ('form', 'legacy (ms)', 'plan (ms)',
+                                  'speedup'))
+    for name, legacy, compiled in cases:
+        # both ways of copying must produce the very same messages
+        assert legacy() == compiled(), '%s forms differ' % name
+        legacy_time = min(timeit.repeat(legacy, number=1,
+                                        repeat=args.repeat)) * 1000
+        compiled_time = min(timeit.repeat(compiled, number=1,
+                                          repeat=args.repeat)) * 1000
+        print('%-16s %12.2f %12.2f %7.1fx' % (
+            name, legacy_time, compiled_time, legacy_time / compiled_time))
+        results[name] = {'legacy_ms': legacy_time,
+                         'plan_ms': compiled_time}
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'items': args.items, 'repeat': args.repeat,
+                       'forms': results}, out, indent=2, sort_keys=True)
+        print('results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""cache.py
+
+Read-through memcache layer for conference and session reads.
+
+Every conference has a generation number in memcache and cached entries are
+keyed on it, so bumping the generation invalidates everything cached for
+that conference at once; the orphaned entries simply expire. Speakers get a
+generation of their own the same way, keyed by the speaker's websafe key.
+Values are the JSON encoded ProtoRPC messages returned by the API, so a hit
+skips both the datastore and the model-to-form copy.
+
+"""
+
+import hashlib
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from protorpc import protojson
+
+MEMCACHE_GENERATION_KEY = "CONFERENCE_GENERATION %s"
+MEMCACHE_ENTRY_KEY = "CONFERENCE_CACHE %s %d %s"
+CACHE_TIME = 60 * 60  # seconds
+
+# per-instance hit and miss counters
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _new_generation():
+    """Return a starting generation that is larger than any generation used
+    before the counter was evicted from memcache.
+    """
+    return int(time.time() * 1000)
+
+
+def get_generation(wsck):
+    """Return the current cache generation of a conference."""
+    key = MEMCACHE_GENERATION_KEY % wsck
+    generation = memcache.get(key)
+    if generation is None:
+        generation = _new_generation()
+        if not memcache.add(key, generation):
+            generation = memcache.get(key) or generation
+    return generation
+
+
+def get_generations(ids):
+    """Return the current cache generations of several conferences (or
+    other ids), with a single memcache call when they are all cached.
+    """
+    keys = [MEMCACHE_GENERATION_KEY % i for i in ids]
+    found = memcache.get_multi(keys)
+    return [found[key] if key in found else get_generation(i)
+            for key, i in zip(keys, ids)]
+
+
+def get_etag(ids):
+    """Return an ETag that changes whenever any of the ids is invalidated;
+    it only needs memcache.
+    """
+    generations = get_generations(ids)
+    return hashlib.md5(' '.join(
+        '%s:%d' % pair for pair in zip(ids, generations))).hexdigest()
+
+
+def invalidate(wsck):
+    """Bump the cache generation of a conference; when called inside a
+    transaction this happens once the transaction commits.
+    """
+    ndb.get_context().call_on_commit(
+        lambda: memcache.incr(MEMCACHE_GENERATION_KEY % wsck,
+                              initial_value=_new_generation()))
+
+
+def get_or_load(wsck, name, message_type, loader):
+    """Return the cached `name` message of a conference, calling `loader`
+    and caching its result on a miss.
+    """
+    key = MEMCACHE_ENTRY_KEY % (wsck, get_generation(wsck), name)
+    encoded = memcache.get(key)
+    if encoded is not None:
+        _stats['hits'] += 1
+        return protojson.decode_message(message_type, encoded)
+
+    _stats['misses'] += 1
+    message = loader()
+    memcache.set(key, protojson.encode_message(message), time=CACHE_TIME)
+    return message
+
+
+def get_or_load_value(wsck, name, loader):
+    """Like get_or_load(), for plain picklable values."""
+    key = MEMCACHE_ENTRY_KEY % (wsck, get_generation(wsck), name)
+    value = memcache.get(key)
+    if value is not None:
+        _stats['hits'] += 1
+        return value
+
+    _stats['misses'] += 1
+    value = loader()
+    memcache.set(key, value, time=CACHE_TIME)
+    return value
+
+
+def get_stats():
+    """Return the hit and miss counters of this instance."""
+    total = _stats['hits'] + _stats['misses']
+    return {'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'hitRatio': float(_stats['hits']) / total if total else 0.0}
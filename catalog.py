@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""catalog.py
+
+Instance-resident snapshot of the conference catalog.
+
+A cron job writes every Conference into a compact, column-oriented and
+versioned snapshot, compressed and split into memcache-sized chunks. Each
+instance loads the snapshot lazily, keeps it in memory together with
+in-process indexes on city, topic and month, and checks for a newer version
+at most every SNAPSHOT_CHECK_SECONDS. queryConferences answers its filters
+from the snapshot whenever one is loaded, without any datastore access;
+results may be up to one cron interval old. Page tokens name the snapshot
+version they page through, so later pages come from the same version for as
+long as memcache keeps it.
+
+"""
+
+import json
+import logging
+import threading
+import time
+import zlib
+
+from google.appengine.api import memcache
+from models import Conference
+from models import ConferenceForm
+from query_planner import matches_values
+import seats
+import serializers
+
+MEMCACHE_VERSION_KEY = "CATALOG VERSION"
+MEMCACHE_CHUNK_KEY = "CATALOG %d %d"
+MEMCACHE_INFO_KEY = "CATALOG INFO %d"
+CHUNK_SIZE = 900 * 1024  # memcache values are limited to 1MB
+BUILD_BATCH_SIZE = 500
+SNAPSHOT_CHECK_SECONDS = 10
+PAGE_TOKEN_PREFIX = 'catalog-'
+# columns holding ConferenceForm fields; rows are kept in name order
+COLUMNS = [field.name for field in ConferenceForm.all_fields()
+           if field.name not in ('etag', 'notModified')]
+INDEXED_COLUMNS = ('city', 'topics', 'month')
+
+
+class Snapshot(object):
+    """Snapshot -- one version of the catalog, with in-process indexes"""
+
+    def __init__(self, version, columns):
+        self.version = version
+        self.columns = columns
+        self.size = len(columns['websafeKey'])
+        # value -> ids of the rows holding it
+        self.indexes = {}
+        for column in INDEXED_COLUMNS:
+            index = self.indexes[column] = {}
+            for row, values in enumerate(columns[column]):
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    index.setdefault(value, set()).add(row)
+
+    def _matches(self, row, filtr):
+        return matches_values(self.columns[filtr["field"]][row], filtr)
+
+    def query(self, filters, page_size, offset=0):
+        """Answer formatted filters from the given offset on; return
+        (ConferenceForms, next page token).
+        """
+        # narrow down with the indexes first, then check what's left
+        rows = None
+        residual = []
+        for filtr in filters:
+            if filtr["operator"] == '=' and filtr["field"] in self.indexes:
+                found = self.indexes[filtr["field"]].get(filtr["value"],
+                                                         set())
+                rows = found if rows is None else rows & found
+            else:
+                residual.append(filtr)
+        rows = range(self.size) if rows is None else sorted(rows)
+        if residual:
+            rows = [row for row in rows
+                    if all(self._matches(row, f) for f in residual)]
+
+        page = rows[offset:offset + page_size]
+        next_token = None
+        if offset + page_size < len(rows):
+            next_token = '%s%d-%d' % (PAGE_TOKEN_PREFIX, self.version,
+                                      offset + page_size)
+        return [self._to_form(row) for row in page], next_token
+
+    def _to_form(self, row):
+        form = ConferenceForm()
+        for column in COLUMNS:
+            value = self.columns[column][row]
+            if value is not None:
+                setattr(form, column, value)
+        return form
+
+
+def is_page_token(page_token):
+    """Tell whether a page token was handed out by a snapshot."""
+    return page_token.startswith(PAGE_TOKEN_PREFIX)
+
+
+def parse_page_token(page_token):
+    """Return (snapshot version, offset) of a snapshot page token; raises
+    ValueError when it is malformed.
+    """
+    version, offset = page_token[len(PAGE_TOKEN_PREFIX):].split('-')
+    if int(offset) < 0:
+        raise ValueError(page_token)
+    return int(version), int(offset)
+
+
+def build_snapshot():
+    """Write a new snapshot of every Conference to memcache."""
+    columns = dict((column, []) for column in COLUMNS)
+    conferences = sorted(
+        Conference.query().iter(batch_size=BUILD_BATCH_SIZE),
+        key=lambda conf: (conf.name, conf.key))
+    forms = serializers.to_forms(conferences, ConferenceForm, Conference)
+    for conf, form in zip(conferences, forms):
+        # free seats of high-demand conferences live in their shards
+        if conf.seatShards:
+            form.seatsAvailable = seats.get_seats_available(conf)
+        for column in COLUMNS:
+            value = getattr(form, column)
+            columns[column].append(list(value) if column == 'topics'
+                                   else value)
+
+    data = zlib.compress(json.dumps(columns, separators=(',', ':')))
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data),
+                                                    CHUNK_SIZE)]
+    version = int(time.time() * 1000)
+    info = {'version': version, 'chunks': len(chunks)}
+    memcache.set_multi(dict((MEMCACHE_CHUNK_KEY % (version, i), chunk)
+                            for i, chunk in enumerate(chunks)))
+    memcache.set(MEMCACHE_INFO_KEY % version, info)
+    # only point readers at the new version once all of it is there
+    memcache.set(MEMCACHE_VERSION_KEY, info)
+    return version
+
+
+def _load(info):
+    """Read and decode the snapshot described by a version record."""
+    keys = [MEMCACHE_CHUNK_KEY % (info['version'], i)
+            for i in range(info['chunks'])]
+    chunks = memcache.get_multi(keys)
+    if len(chunks) != len(keys):
+        logging.warning('catalog snapshot %d is incomplete', info['version'])
+        return None
+    columns = json.loads(zlib.decompress(''.join(chunks[k] for k in keys)))
+    return Snapshot(info['version'], columns)
+
+
+_snapshot = None
+_previous = None  # an older version clients are still paging through
+_checked = 0
+_lock = threading.Lock()
+
+
+def get_snapshot(version=None):
+    """Return this instance's snapshot, loading a newer version when one has
+    been published, or the given version; None when it isn't available.
+    """
+    current = _get_current()
+    if version is None or (current and current.version == version):
+        return current
+    return _get_version(version)
+
+
+def _get_version(version):
+    """Return a specific version of the snapshot while memcache has it."""
+    global _previous
+    with _lock:
+        if not _previous or _previous.version != version:
+            info = memcache.get(MEMCACHE_INFO_KEY % version)
+            snapshot = _load(info) if info else None
+            if not snapshot:
+                return None
+            _previous = snapshot
+        return _previous
+
+
+def _get_current():
+    """Return the latest snapshot, checking memcache for a new version at
+    most every SNAPSHOT_CHECK_SECONDS.
+    """
+    global _snapshot, _checked
+    if time.time() - _checked < SNAPSHOT_CHECK_SECONDS:
+        return _snapshot
+    with _lock:
+        if time.time() - _checked >= SNAPSHOT_CHECK_SECONDS:
+            info = memcache.get(MEMCACHE_VERSION_KEY)
+            if not info:
+                _snapshot = None
+            elif not _snapshot or _snapshot.version != info['version']:
+                _snapshot = _load(info) or _snapshot
+            _checked = time.time()
+    return _snapshot
@@ -1,20 +1,37 @@
 #!/usr/bin/env python
 from datetime import datetime
+import csv
+import json
+import logging
+import StringIO
+import time
+import uuid
 import endpoints
 from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 from google.appengine.api import memcache
+from google.appengine.api import search
 from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
+from models import AttendeeForm
+from models import AttendeeForms
+from models import DashboardForm
 from models import ConflictException
+from models import ConferenceImportForm
+from models import ImportJob
+from models import ImportJobForm
 from models import Session
 from models import SessionForm
 from models import SessionForms
+from models import SessionQueryForms
 from models import TypeOfSession
+from models import WishlistEntry
 from models import Speaker
 from models import SpeakerForm
 from models import SpeakerForms
+from models import SpeakerSession
+from models import SpeakerSessionCount
 from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
@@ -24,12 +41,30 @@ from models import Conference
 from models import ConferenceForm
 from models import ConferenceForms
 from models import ConferenceQueryForms
+from models import Registration
+from models import RegistrationStatus
+from models import RegistrationTicket
+from models import RegistrationTicketForm
+from models import SearchForm
 from models import TeeShirtSize
 from settings import WEB_CLIENT_ID
 from settings import ANDROID_CLIENT_ID
 from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
+from utils import add_bucketed_task
+from utils import add_named_tasks
+from utils import bucketed_task
+from utils import chain_batch
+from utils import fetch_batch
 from utils import getUserId
+import cache
+import catalog
+from instrumentation import instrument
+import notifications
+import query_planner
+import search_index
+import seats
+import serializers
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 """
@@ -45,12 +80,41 @@ created by wesc on 2014 apr 21
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED SPEAKER"
+MEMCACHE_CONF_FEATURED_SPEAKER_KEY = "FEATURED SPEAKER %s"
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+ORGANIZER_UPDATE_BATCH_SIZE = 100
+REGISTRATION_QUEUE = 'registration-intents'
+REGISTRATION_LEASE_SECONDS = 60
+REGISTRATION_LEASE_SIZE = 100
+REGISTRATION_LEASE_ROUNDS = 10
+REGISTRATION_KICK_INTERVAL = 5  # seconds
+REGISTRATION_MIGRATION_BATCH_SIZE = 100
+WISHLIST_MIGRATION_BATCH_SIZE = 100
+SPEAKER_INDEX_BATCH_SIZE = 100
+ROSTER_EXPORT_BATCH_SIZE = 1000
+MAX_BULK_SESSIONS = 100  # most tasks one taskqueue add takes
+MAX_IMPORT_ROWS = 10000
+IMPORT_CHUNK_SIZE = 50
+# chunk tasks carry their rows as JSON and tasks are limited to 100KB
+IMPORT_CHUNK_BYTES = 64 * 1024
+MAX_IMPORT_ROW_BYTES = 16 * 1024
+IMPORT_TASKS_PER_ADD = 100
+MAX_IMPORT_ERRORS = 100
+IMPORT_FIELDS = ('name', 'description', 'topics', 'city', 'startDate',
+                 'endDate', 'maxAttendees')
+XG_ENTITY_GROUP_LIMIT = 25
+FEATURED_SPEAKER_INTERVAL = 10  # seconds
 FEATURED_SPEAKER_ANNOUNCEMENT = "Conference %s: \n" \
                                 "Speaker: %s \n" \
                                 "Sessions: %s"
+IMPORT_SUMMARY_TPL = ('Hi, your conference import has finished.\r\n\r\n'
+                      'Imported %d of %d conferences, %d failed.\r\n\r\n%s')
 ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
                     'are nearly sold out: %s')
+# conferences with this many free seats or fewer are nearly sold out
+NEARLY_SOLD_OUT_SEATS = 5
+# announcement rebuilds are batched into windows of this many seconds
+ANNOUNCEMENT_DEBOUNCE_SECONDS = 10
 # - - - - Globals - - - - - - - - - - - - - - - - - - - - - - - - -
 SESS_DEFAULTS = {"duration": 0, "typeOfSession": TypeOfSession.Not_Specified}
 
@@ -70,6 +134,11 @@ OPERATORS = {
     'NE': '!='
 }
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# wishlist sessions shown on the dashboard
+DASHBOARD_WISHLIST_SIZE = 5
+
 FIELDS = {
     'CITY': 'city',
     'TOPIC': 'topics',
@@ -77,20 +146,57 @@ FIELDS = {
     'MAX_ATTENDEES': 'maxAttendees',
 }
 
+SESS_FIELDS = {
+    'TYPE': 'typeOfSession',
+    'START_TIME': 'startTime',
+    'DURATION': 'duration',
+    'DATE': 'date',
+}
+
+# ConferenceForm fields clients can't write
+CONF_READ_ONLY_FIELDS = ('websafeKey', 'organizerDisplayName', 'version',
+                         'etag', 'notModified')
+
+# turn filter values from strings into the property's type
+FILTER_VALUES = {
+    'month': int,
+    'maxAttendees': int,
+    'duration': int,
+    'date': lambda value: datetime.strptime(value[:10], "%Y-%m-%d").date(),
+    'startTime': lambda value: datetime.strptime(value[:5], "%H:%M").time(),
+    'typeOfSession': lambda value: str(TypeOfSession(value)),
+}
+
+# Conference fields from most to least selective; each one has a composite
+# index on (field, name) in index.yaml
+CONF_FILTER_SELECTIVITY = ['city', 'topics', 'month', 'maxAttendees']
+
+# Session fields from most to least selective; each one has a composite
+# index on (field, name), with and without the conference as ancestor
+SESS_FILTER_SELECTIVITY = ['date', 'typeOfSession', 'startTime', 'duration']
+
 SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    websafeConferenceKey=messages.StringField(1))
+    speakerKey=messages.StringField(1, required=True),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3))
 
 SPEAKER_BY_CONFERENCE_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1))
 
+FEATURED_SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1))
+
 WISHLIST_POST_REQUEST = endpoints.ResourceContainer(
     websafeSessionKey=messages.StringField(1))
 
-SESS_BY_SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
+WISHLIST_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    speakerKey=messages.StringField(1, required=True))
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3))
 
 SESS_BY_DATE_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
@@ -110,10 +216,37 @@ SESS_POST_REQUEST = endpoints.ResourceContainer(
     SessionForm,
     websafeConferenceKey=messages.StringField(1))
 
+SESSIONS_POST_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(1))
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1))
 
+CONF_READ_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2))
+
+ATTENDING_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1))
+
+IMPORT_JOB_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    jobId=messages.StringField(1, required=True))
+
+TICKET_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ticketId=messages.StringField(1, required=True))
+
+ROSTER_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3))
+
 CONF_POST_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1))
@@ -129,6 +262,11 @@ class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
     # - - - - Wishlist section - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _get_wishlist_key(p_key, wssk):
+        """Return the key of a session's entry on a profile's wishlist."""
+        return ndb.Key(WishlistEntry, wssk, parent=p_key)
+
     def _add_session_to_wishlist(self, request, add=True):
         """ adds the session to the user's list of session they are interested
          in attending
@@ -137,8 +275,6 @@ class ConferenceApi(remote.Service):
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException("Authorization required.")
-        # Get the users profile
-        prof = self._get_profile_from_user()
         # check if conf exists given websafeConfKey
         # get session; check that it exists
 
@@ -147,34 +283,44 @@ class ConferenceApi(remote.Service):
         except Exception:
             raise endpoints.BadRequestException(
                 "the websafeSessionKey given is not valid.")
+        if s_key.kind() != Session._get_kind():
+            raise endpoints.BadRequestException(
+                "the websafeSessionKey given is not valid.")
+
+        # Get the session and the wishlist entry in parallel; entries are
+        # keyed by session, so membership is a single key get
+        w_key = self._get_wishlist_key(
+            ndb.Key(Profile, getUserId(user)), s_key.urlsafe())
+        session_future = s_key.get_async()
+        entry_future = w_key.get_async()
+        session = session_future.get_result()
+        entry = entry_future.get_result()
 
         # Check if the session exists
-        session = s_key.get()
         if not session:
             raise endpoints.NotFoundException(
-                'No session found with key: {}').format(session)
+                'No session found with key: {}'.format(
+                    request.websafeSessionKey))
 
         # Add to wishlist
         if add:
             # Check if user already has this session in wishlist
-            if session in prof.sessionWishList:
+            if entry:
                 raise ConflictException(
                     "You have already have this session in your wishlist")
             # Add to wishlist
-            prof.sessionWishList.append(session.key.urlsafe())
+            WishlistEntry(key=w_key, conferenceKey=s_key.parent()).put()
             return_value = True
         # Remove session from wishlist
         else:
-            # check if user already registered
-            if session in prof.sessionWishList:
+            # check if the session is on the wishlist
+            if entry:
                 # Remove session
-                prof.sessionWishList.remove(session)
+                w_key.delete()
                 return_value = True
             else:
                 return_value = False
 
-        # Write changes back to the datastore & return
-        prof.put()
         return BooleanMessage(data=return_value)
 
     @endpoints.method(WISHLIST_POST_REQUEST,
@@ -182,6 +328,7 @@ class ConferenceApi(remote.Service):
                       path="addSessionToWishList/{websafeSessionKey}",
                       http_method="POST",
                       name="addSessionToWishList")
+    @instrument
     def add_session_to_wishlist(self, request):
         """
         Adds the session to the user's list of sessions they are interested in
@@ -194,6 +341,7 @@ class ConferenceApi(remote.Service):
                       path="removeSessionFromWishList/{websafeSessionKey}",
                       http_method="POST",
                       name="removeSessionFromWishList")
+    @instrument
     def remove_session_from_wishlist(self, request):
         """
         Removes the session from the user's list of session they are interest
@@ -201,23 +349,81 @@ class ConferenceApi(remote.Service):
         """
         return self._add_session_to_wishlist(request, add=False)
 
-    @endpoints.method(message_types.VoidMessage,
+    @endpoints.method(WISHLIST_GET_REQUEST,
                       SessionForms,
                       path='wishlist',
                       http_method='GET',
                       name='getSessionsInWishList')
+    @instrument
     def get_sessions_in_wishlist(self, request):
         """
-        Query for all the sessions in a conference that the user is interested
-        in
+        Query for the sessions the user is interested in, one page at a time,
+        optionally only those of one conference
         """
         # Get the users profile
-        user = self._get_profile_from_user()
-        # Get keys in wishlist
-        s_keys = [ndb.Key(urlsafe=wsck) for wsck in user.sessionWishList]
-        sessions = ndb.get_multi(s_keys)
+        prof = self._get_profile_from_user()
+        page_size = self._get_page_size(request.pageSize)
+        cursor = self._get_cursor(request.pageToken)
+
+        query = WishlistEntry.query(ancestor=prof.key)
+        if request.websafeConferenceKey:
+            query = query.filter(WishlistEntry.conferenceKey ==
+                                 self._get_conference_key(
+                                     request.websafeConferenceKey))
+        # Get a page of keys in wishlist, ids are the session keys
+        w_keys, next_cursor, more = query.fetch_page(
+            page_size, start_cursor=cursor, keys_only=True)
+        sessions = ndb.get_multi([ndb.Key(urlsafe=w_key.id())
+                                  for w_key in w_keys])
         return SessionForms(
-            items=[self._copy_session_to_form(s) for s in sessions])
+            items=self._copy_sessions_to_forms(
+                [session for session in sessions if session]),
+            nextPageToken=(next_cursor.urlsafe()
+                           if more and next_cursor else None))
+
+    @staticmethod
+    def _migrate_wishlists(websafe_cursor=None):
+        """Move a batch of profiles' sessionWishList lists into WishlistEntry
+        entities; chains another task until all profiles are done.
+        """
+        profiles, next_cursor = fetch_batch(
+            Profile.query(), WISHLIST_MIGRATION_BATCH_SIZE, websafe_cursor)
+        for prof in profiles:
+            if prof.sessionWishList:
+                ConferenceApi._migrate_profile_wishlist(prof.key)
+
+        chain_batch('/tasks/migrate_wishlists', next_cursor)
+
+    @staticmethod
+    def _is_session_key(websafe_key):
+        """Tell whether a websafe key is a Session's key."""
+        try:
+            key = ndb.Key(urlsafe=websafe_key)
+        except Exception:
+            return False
+        return key.kind() == Session._get_kind() and key.parent() is not None
+
+    @staticmethod
+    @ndb.transactional()
+    def _migrate_profile_wishlist(p_key):
+        """Move one profile's sessionWishList into WishlistEntry entities,
+        in the profile's entity group.
+        """
+        prof = p_key.get()
+        if not prof or not prof.sessionWishList:
+            return
+        # the old list took any entity's key; only sessions, which are
+        # children of their conference, are kept
+        w_keys = [ConferenceApi._get_wishlist_key(p_key, wssk)
+                  for wssk in set(prof.sessionWishList)
+                  if ConferenceApi._is_session_key(wssk)]
+        ndb.put_multi([
+            WishlistEntry(key=w_key,
+                          conferenceKey=ndb.Key(urlsafe=w_key.id()).parent())
+            for w_key, entry in zip(w_keys, ndb.get_multi(w_keys))
+            if not entry])
+        prof.sessionWishList = []
+        prof.put()
 
     # - - - - Speaker section - - - - - - - - - - - - - - - - - -
 
@@ -225,27 +431,26 @@ class ConferenceApi(remote.Service):
                       path="conference/avialableSeats",
                       http_method="GET",
                       name="getConferencesWithOpenSlots")
+    @instrument
     def get_conferences_with_open_slots(self, request):
         """ Queries after conferences that are not full  """
         # Make sure that the user is authenticated
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
 
         # Filter on conferences that has seats available
         available_seats = Conference.query().filter(Conference.seatsAvailable > 0).order(
             Conference.seatsAvailable)
-        prof = ndb.Key(Profile, user_id).get()
-        return ConferenceForms(items=[
-            self._copy_conference_to_form(conf, getattr(prof, 'displayName'))
-            for conf in available_seats])
+        return ConferenceForms(
+            items=self._copy_conferences_to_forms(available_seats))
 
     @endpoints.method(SpeakerForm,
                       SpeakerForm,
                       path="createSpeaker",
                       http_method="POST",
                       name="createSpeakerObject")
+    @instrument
     def create_speaker(self, request):
         """  Create new speaker """
         return self._create_speaker_object(request)
@@ -270,43 +475,28 @@ class ConferenceApi(remote.Service):
 
     def _copy_speaker_to_form(self, copy_speaker):
         """ Copy relevant fields from Speaker to SpeakerForm """
-        sf = SpeakerForm()
-        for field in sf.all_fields():
-            if hasattr(copy_speaker, field.name):
-                setattr(sf, field.name, getattr(copy_speaker, field.name))
-            if field.name == "websafeKey":
-                setattr(sf, field.name, copy_speaker.key.urlsafe())
-        sf.check_initialized()
-        return sf
+        return serializers.to_form(copy_speaker, SpeakerForm)
 
     # - - - - Conference section - - - - - - - - - - - - - - - - - -
-    def _copy_conference_to_form(self, conf, display_name):
+    def _copy_conference_to_form(self, conf):
         """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if display_name:
-            setattr(cf, 'organizerDisplayName', display_name)
-        cf.check_initialized()
-        return cf
+        return self._copy_conferences_to_forms([conf])[0]
+
+    def _copy_conferences_to_forms(self, conferences):
+        """Copy a list of Conferences to ConferenceForms."""
+        conferences = list(conferences)
+        forms = serializers.to_forms(conferences, ConferenceForm, Conference)
+        # free seats of high-demand conferences live in their shards
+        for conf, cf in zip(conferences, forms):
+            if conf.seatShards:
+                cf.seatsAvailable = seats.get_seats_available(conf)
+        return forms
 
-    def _create_conference_object(self, request):
-        """
-        Create or update Conference object, returning ConferenceForm/request.
+    @staticmethod
+    def _get_conference_data(request):
+        """Validate a new ConferenceForm and turn it into Conference
+        properties, without the key and organizer fields.
         """
-        # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-
         if not request.name:
             raise endpoints.BadRequestException(
                 "Conference 'name' field required")
@@ -314,8 +504,8 @@ class ConferenceApi(remote.Service):
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
-        del data['websafeKey']
-        del data['organizerDisplayName']
+        for field in CONF_READ_ONLY_FIELDS:
+            del data[field]
 
         # Add default values for those missing
         # (both data model & outbound Message)
@@ -339,6 +529,26 @@ class ConferenceApi(remote.Service):
         # set seatsAvailable to be same as maxAttendees on creation
         if data["maxAttendees"] > 0:
             data["seatsAvailable"] = data["maxAttendees"]
+        data['nearlySoldOut'] = ConferenceApi._is_nearly_sold_out(
+            data['seatsAvailable'])
+        return data
+
+    def _create_conference_object(self, request):
+        """
+        Create or update Conference object, returning ConferenceForm/request.
+        """
+        # preload necessary data items
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+
+        data = self._get_conference_data(request)
+
+        # the organizer's display name is stored on the conference so that
+        # listings don't have to read the Profile entities
+        prof = self._get_profile_from_user()
+
         # generate Profile Key based on user ID and Conference
         # ID based on Profile key get Conference key from ID
         p_key = ndb.Key(Profile, user_id)
@@ -346,17 +556,30 @@ class ConferenceApi(remote.Service):
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
+        data['organizerDisplayName'] = request.organizerDisplayName = \
+            prof.displayName
+
+        # spread the seats of high-demand conferences over counter shards
+        data['seatShards'] = seats.shard_count_for(data['seatsAvailable'])
+        if data['seatShards']:
+            seats.create_shards(c_key, data['seatsAvailable'],
+                                data['seatShards'])
 
-        # create Conference, send email to organizer confirming
+        # create Conference, queue the email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
         Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-                              'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email')
+        search_index.schedule_update(c_key)
+        if data['nearlySoldOut']:
+            self._schedule_announcement()
+        notifications.queue_confirmation(user.email(), request)
         return request
 
     @ndb.transactional()
     def _update_conference_object(self, request):
+        """Update a conference from a ConferenceForm; returns the stored
+        Conference. Forms are built by the caller, after the commit, since
+        the seat shards of a sharded conference are other entity groups.
+        """
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
@@ -378,6 +601,10 @@ class ConferenceApi(remote.Service):
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
+            # the key, organizer display name and version are not
+            # user-modifiable
+            if field.name in CONF_READ_ONLY_FIELDS:
+                continue
             data = getattr(request, field.name)
             # only copy fields where we get data
             if data not in (None, []):
@@ -388,16 +615,19 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        self._update_nearly_sold_out(conf)
+        conf.version += 1
         conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copy_conference_to_form(conf,
-                                             getattr(prof, 'displayName'))
+        cache.invalidate(conf.key.urlsafe())
+        search_index.schedule_update(conf.key, transactional=True)
+        return conf
 
     @endpoints.method(ConferenceForm,
                       ConferenceForm,
                       path='conference',
                       http_method='POST',
                       name='createConference')
+    @instrument
     def create_conference(self, request):
         """Create new conference."""
         return self._create_conference_object(request)
@@ -407,33 +637,71 @@ class ConferenceApi(remote.Service):
                       path='conference/{websafeConferenceKey}',
                       http_method='PUT',
                       name='updateConference')
+    @instrument
     def update_conference(self, request):
         """Update conference w/provided fields & return w/updated info."""
-        return self._update_conference_object(request)
+        return self._copy_conference_to_form(
+            self._update_conference_object(request))
 
-    @endpoints.method(CONF_GET_REQUEST,
+    @endpoints.method(CONF_READ_REQUEST,
                       ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET',
                       name='getConference')
+    @instrument
     def get_conference(self, request):
-        """Return requested conference by websafeConferenceKey."""
+        """Return requested conference by websafeConferenceKey; only an ETag
+        when the client's copy is still current.
+        """
+        c_key = self._get_conference_key(request.websafeConferenceKey)
+        etag = cache.get_etag([c_key.urlsafe()])
+        if etag == self._get_if_none_match(request):
+            return ConferenceForm(etag=etag, notModified=True)
+        conf = cache.get_or_load(c_key.urlsafe(), 'conference',
+                                 ConferenceForm,
+                                 lambda: self._load_conference_form(c_key))
+        conf.etag = etag
+        return conf
+
+    def _get_if_none_match(self, request):
+        """Return the ETag of the client's copy, from the request or from
+        the If-None-Match header.
+        """
+        if request.ifNoneMatch:
+            return request.ifNoneMatch
+        state = getattr(self, 'request_state', None)
+        header = state.headers.get('If-None-Match') if state else None
+        return header.strip('"') if header else None
+
+    def _load_conference_form(self, c_key):
+        """Read a conference from the datastore and return its form."""
         # get Conference object from request
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = c_key.get()
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' %
-                request.websafeConferenceKey)
-        prof = conf.key.parent().get()
+                'No conference found with key: %s' % c_key.urlsafe())
         # return ConferenceForm
-        return self._copy_conference_to_form(conf,
-                                             getattr(prof, 'displayName'))
+        return self._copy_conference_to_form(conf)
+
+    @staticmethod
+    def _get_conference_key(websafe_conference_key):
+        """Return the Conference key for a websafeConferenceKey."""
+        try:
+            c_key = ndb.Key(urlsafe=websafe_conference_key)
+        except Exception:
+            raise endpoints.BadRequestException(
+                "websafeConferenceKey is not valid.")
+        if c_key.kind() != Conference._get_kind():
+            raise endpoints.BadRequestException(
+                "websafeConferenceKey is not valid.")
+        return c_key
 
     @endpoints.method(message_types.VoidMessage,
                       ConferenceForms,
                       path='getConferencesCreated',
                       http_method='POST',
                       name='getConferencesCreated')
+    @instrument
     def get_conferences_created(self, request):
         """Return conferences created by user."""
         # Make sure user is authenticated
@@ -444,91 +712,413 @@ class ConferenceApi(remote.Service):
 
         # Create ancestor query for all key matches for this user
         conferences = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[
-            self._copy_conference_to_form(conf, getattr(
-                prof, 'displayName')) for conf in conferences
-            ])
+        return ConferenceForms(
+            items=self._copy_conferences_to_forms(conferences))
 
     @endpoints.method(ConferenceQueryForms,
                       ConferenceForms,
                       path='queryConferences',
                       http_method='POST',
                       name='queryConferences')
+    @instrument
     def query_conferences(self, request):
-        """Query for conferences."""
-        conferences = self._get_query(request)
+        """Query for conferences, one page at a time."""
+        page_size = self._get_page_size(request.pageSize)
+
+        # answer from this instance's catalog snapshot when there is one,
+        # unless the client is paging through datastore results; later
+        # pages come from the snapshot version of the first one
+        snapshot = None
+        offset = 0
+        if not request.pageToken:
+            snapshot = catalog.get_snapshot()
+        elif catalog.is_page_token(request.pageToken):
+            try:
+                version, offset = catalog.parse_page_token(request.pageToken)
+            except ValueError:
+                raise endpoints.BadRequestException("Invalid pageToken.")
+            snapshot = catalog.get_snapshot(version)
+            if not snapshot:
+                raise endpoints.BadRequestException(
+                    "pageToken has expired since the conference catalog "
+                    "changed; query again without a pageToken.")
+        if snapshot:
+            items, next_token = snapshot.query(
+                self._format_filters(request.filters), page_size, offset)
+            return ConferenceForms(items=items, nextPageToken=next_token)
+        cursor = self._get_cursor(request.pageToken)
+
+        # run the query once and keep only the requested page; filters the
+        # datastore query can't serve are applied while streaming
+        query, residual = self._get_query(request)
+        conferences, next_cursor, more = query_planner.fetch_page(
+            query, residual, page_size, start_cursor=cursor)
+
+        # return individual ConferenceForm object per Conference
+        return ConferenceForms(
+            items=self._copy_conferences_to_forms(conferences),
+            nextPageToken=(next_cursor.urlsafe()
+                           if more and next_cursor else None))
+
+    # - - - - Bulk import section - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _parse_import_payload(payload, payload_format):
+        """Turn a JSON list of objects or a CSV file with a header row into
+        a list of row dicts.
+        """
+        if payload_format == 'json':
+            try:
+                rows = json.loads(payload)
+            except ValueError:
+                raise endpoints.BadRequestException(
+                    "payload is not valid JSON.")
+            if not isinstance(rows, list) or \
+                    not all(isinstance(row, dict) for row in rows):
+                raise endpoints.BadRequestException(
+                    "payload must be a JSON list of conferences.")
+            return rows
+        if payload_format == 'csv':
+            reader = csv.DictReader(
+                StringIO.StringIO(payload.encode('utf-8')))
+            return [dict((field, value.decode('utf-8'))
+                         for field, value in row.items()
+                         if field and value is not None)
+                    for row in reader]
+        raise endpoints.BadRequestException(
+            "format must be 'json' or 'csv'.")
 
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId))
-                      for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+    @staticmethod
+    def _get_import_form(row):
+        """Build a ConferenceForm from one imported row; CSV rows separate
+        topics with ';'.
+        """
+        form = ConferenceForm()
+        for field in IMPORT_FIELDS:
+            value = row.get(field)
+            if value in (None, '', []):
+                continue
+            if field == 'maxAttendees':
+                value = int(value)
+            elif field == 'topics' and not isinstance(value, list):
+                value = [topic.strip() for topic in value.split(';')
+                         if topic.strip()]
+            setattr(form, field, value)
+        return form
+
+    def _copy_import_job_to_form(self, job):
+        """Copy relevant fields from ImportJob to ImportJobForm."""
+        return ImportJobForm(
+            jobId=job.key.id(),
+            status=job.status,
+            total=job.total,
+            imported=job.imported,
+            failed=job.failed,
+            errors=job.errors)
+
+    @endpoints.method(ConferenceImportForm,
+                      ImportJobForm,
+                      path='conferences/import',
+                      http_method='POST',
+                      name='importConferences')
+    @instrument
+    def import_conferences(self, request):
+        """Import many conferences from a JSON or CSV payload in the
+        background; returns a job to poll with getImportJob.
+        """
+        prof = self._get_profile_from_user()
+        rows = self._parse_import_payload(
+            request.payload, (request.format or 'json').lower())
+        if not rows:
+            raise endpoints.BadRequestException("No conferences given.")
+        if len(rows) > MAX_IMPORT_ROWS:
+            raise endpoints.BadRequestException(
+                "At most %d conferences can be imported at once." %
+                MAX_IMPORT_ROWS)
+        # the chunk tasks only carry the fields that get imported
+        rows = [dict((field, row[field]) for field in IMPORT_FIELDS
+                     if field in row) for row in rows]
+        for i, row in enumerate(rows):
+            if len(json.dumps(row)) > MAX_IMPORT_ROW_BYTES:
+                raise endpoints.BadRequestException(
+                    "Row %d is larger than %d bytes." % (
+                        i + 1, MAX_IMPORT_ROW_BYTES))
+
+        # ids are allocated up front, so a retried chunk writes the same
+        # keys again instead of duplicating conferences
+        first_id, _ = Conference.allocate_ids(size=len(rows), parent=prof.key)
+        chunks = self._chunk_import_rows(rows)
+        job = ImportJob(key=ndb.Key(ImportJob, uuid.uuid4().hex,
+                                    parent=prof.key),
+                        total=len(rows), chunks=len(chunks))
+        job.put()
+        tasks = [taskqueue.Task(
+            url='/tasks/import_conferences',
+            payload=json.dumps({'job': job.key.urlsafe(),
+                                'chunk': chunk,
+                                'first_row': first_row,
+                                'first_id': first_id + first_row,
+                                'rows': chunk_rows}))
+            for chunk, (first_row, chunk_rows) in enumerate(chunks)]
+        queue = taskqueue.Queue()
+        try:
+            for i in range(0, len(tasks), IMPORT_TASKS_PER_ADD):
+                queue.add(tasks[i:i + IMPORT_TASKS_PER_ADD])
+        except taskqueue.Error as e:
+            logging.exception('could not queue import %s', job.key.id())
+            job = self._fail_import(job.key, 'the import could not be '
+                                    'queued: %s' % type(e).__name__)
+        return self._copy_import_job_to_form(job)
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+    @staticmethod
+    def _chunk_import_rows(rows):
+        """Split rows into (first row, rows) chunks of at most
+        IMPORT_CHUNK_SIZE rows and about IMPORT_CHUNK_BYTES of JSON.
+        """
+        chunks = []
+        start = size = 0
+        for i, row in enumerate(rows):
+            row_size = len(json.dumps(row))
+            if i > start and (i - start == IMPORT_CHUNK_SIZE or
+                              size + row_size > IMPORT_CHUNK_BYTES):
+                chunks.append((start, rows[start:i]))
+                start, size = i, 0
+            size += row_size
+        if start < len(rows):
+            chunks.append((start, rows[start:]))
+        return chunks
 
-        # return individual ConferenceForm object per Conference
-        return ConferenceForms(items=[
-            self._copy_conference_to_form(conf, names[
-                conf.organizerUserId]) for conf in conferences])
+    @staticmethod
+    @ndb.transactional()
+    def _fail_import(job_key, error):
+        """Mark an import as failed; chunks that already run still record
+        their outcome, but the job is never completed.
+        """
+        job = job_key.get()
+        job.status = 'FAILED'
+        job.errors.append(error)
+        job.put()
+        return job
+
+    @endpoints.method(IMPORT_JOB_GET_REQUEST,
+                      ImportJobForm,
+                      path='conferences/import/{jobId}',
+                      http_method='GET',
+                      name='getImportJob')
+    @instrument
+    def get_import_job(self, request):
+        """Return the progress of a conference import."""
+        prof = self._get_profile_from_user()
+        job = ndb.Key(ImportJob, request.jobId, parent=prof.key).get()
+        if not job:
+            raise endpoints.NotFoundException(
+                'No import found with id: %s' % request.jobId)
+        return self._copy_import_job_to_form(job)
+
+    @staticmethod
+    def _import_conference_chunk(websafe_job_key, chunk, first_row, first_id,
+                                 rows):
+        """Validate one chunk of an import and store its conferences with
+        one put_multi, then record the chunk on the job; first_row is the
+        chunk's offset in the import.
+        """
+        job_key = ndb.Key(urlsafe=websafe_job_key)
+        p_key = job_key.parent()
+        job, prof = ndb.get_multi([job_key, p_key])
+        if not job or not prof or chunk in job.chunksDone:
+            return
+
+        conferences = []
+        errors = []
+        for i, row in enumerate(rows):
+            row_number = first_row + i + 1
+            try:
+                data = ConferenceApi._get_conference_data(
+                    ConferenceApi._get_import_form(row))
+            except (endpoints.BadRequestException, messages.ValidationError,
+                    TypeError, ValueError) as e:
+                errors.append('row %d: %s' % (row_number, e))
+                continue
+            c_key = ndb.Key(Conference, first_id + i, parent=p_key)
+            data['key'] = c_key
+            data['organizerUserId'] = p_key.id()
+            data['organizerDisplayName'] = prof.displayName
+            data['seatShards'] = seats.shard_count_for(data['seatsAvailable'])
+            if data['seatShards']:
+                seats.create_shards(c_key, data['seatsAvailable'],
+                                    data['seatShards'])
+            conferences.append(Conference(**data))
+        ndb.put_multi(conferences)
+        if conferences:
+            search_index.schedule_updates([conf.key for conf in conferences])
+        if any(conf.nearlySoldOut for conf in conferences):
+            ConferenceApi._schedule_announcement()
+        ConferenceApi._finish_import_chunk(job_key, chunk, len(conferences),
+                                           errors, prof.mainEmail)
+
+    @staticmethod
+    @ndb.transactional()
+    def _finish_import_chunk(job_key, chunk, imported, errors, email):
+        """Add a chunk's outcome to its job; the last chunk completes the job
+        and queues the one summary email.
+        """
+        job = job_key.get()
+        if chunk in job.chunksDone:
+            return
+        job.chunksDone.append(chunk)
+        job.imported += imported
+        job.failed += len(errors)
+        job.errors.extend(errors[:MAX_IMPORT_ERRORS - len(job.errors)])
+        if len(job.chunksDone) == job.chunks and job.status == 'RUNNING':
+            job.status = 'DONE'
+            taskqueue.add(params={'email': email,
+                                  'summary': IMPORT_SUMMARY_TPL % (
+                                      job.imported, job.total, job.failed,
+                                      '\r\n'.join(job.errors))},
+                          url='/tasks/send_import_summary',
+                          transactional=True)
+        job.put()
+
+    # - - - - Paging section - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _get_page_size(page_size):
+        """Return a page size within the allowed bounds."""
+        if not page_size:
+            return DEFAULT_PAGE_SIZE
+        if page_size < 0:
+            raise endpoints.BadRequestException(
+                "pageSize must be a positive number.")
+        return min(page_size, MAX_PAGE_SIZE)
+
+    @staticmethod
+    def _get_cursor(page_token):
+        """Turn an opaque page token back into a datastore cursor."""
+        if not page_token:
+            return None
+        try:
+            return ndb.Cursor(urlsafe=page_token)
+        except Exception:
+            raise endpoints.BadRequestException(
+                "the pageToken given is not valid.")
+
+    # - - - - Search section - - - - - - - - - - - - - - - - - -
+    def _search(self, index_name, request):
+        """Run a ranked full-text search; return the matching entities in
+        rank order and the token of the next page.
+        """
+        query_string = request.query
+        if request.websafeConferenceKey:
+            c_key = self._get_conference_key(request.websafeConferenceKey)
+            query_string = '(%s) conference:"%s"' % (query_string,
+                                                     c_key.urlsafe())
+        try:
+            keys, next_page = search_index.search_keys(
+                index_name, query_string,
+                self._get_page_size(request.pageSize), request.pageToken)
+        except search.QueryError:
+            raise endpoints.BadRequestException(
+                "the query given is not valid.")
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "the pageToken given is not valid.")
+        # the index can briefly lag behind the datastore
+        return [e for e in ndb.get_multi(keys) if e], next_page
+
+    @endpoints.method(SearchForm,
+                      ConferenceForms,
+                      path='searchConferences',
+                      http_method='POST',
+                      name='searchConferences')
+    @instrument
+    def search_conferences(self, request):
+        """Full-text search over conferences, best matches first."""
+        conferences, next_page = self._search(
+            search_index.CONFERENCE_INDEX, request)
+        return ConferenceForms(
+            items=self._copy_conferences_to_forms(conferences),
+            nextPageToken=next_page)
+
+    @endpoints.method(SearchForm,
+                      SessionForms,
+                      path='searchSessions',
+                      http_method='POST',
+                      name='searchSessions')
+    @instrument
+    def search_sessions(self, request):
+        """Full-text search over sessions, optionally within a conference,
+        best matches first.
+        """
+        sessions, next_page = self._search(search_index.SESSION_INDEX,
+                                           request)
+        return SessionForms(items=self._copy_sessions_to_forms(sessions),
+                            nextPageToken=next_page)
 
     # - - - - Filters section - - - - - - - - - - - - - - - - - -
-    def _format_filters(self, filters):
+    def _format_filters(self, filters, fields=FIELDS):
         """Parse, check validity and format user supplied filters."""
         formatted_filters = []
-        inequality_field = None
 
         for f in filters:
             filtr = {field.name: getattr(f, field.name)
                      for field in f.all_fields()}
 
             try:
-                filtr["field"] = FIELDS[filtr["field"]]
+                filtr["field"] = fields[filtr["field"]]
                 filtr["operator"] = OPERATORS[filtr["operator"]]
             except KeyError:
                 raise endpoints.BadRequestException(
                     "Filter contains invalid field or operator.")
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                """
-                Check if inequality operation has been used in previous
-                filters.
-                Disallow the filter if inequality was performed on a different
-                field before.
-                Track the field on which the inequality operation is performed.
-                """
-                if inequality_field and inequality_field != filtr["field"]:
+            if filtr["field"] in FILTER_VALUES:
+                try:
+                    filtr["value"] = FILTER_VALUES[filtr["field"]](
+                        filtr["value"])
+                except (TypeError, ValueError):
                     raise endpoints.BadRequestException(
-                        "Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
+                        "Filter on %s has an invalid value." %
+                        filtr["field"])
 
             formatted_filters.append(filtr)
-        return inequality_field, formatted_filters
+        return formatted_filters
 
     # - - - - Query section - - - - - - - - - - - - - - - - - -
     def _get_query(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
-        inequality_filter, filters = self._format_filters(request.filters)
-        # If exists, sort on inequality FILTER first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
-        for FILTER in filters:
-            if FILTER["field"] in ["month", "maxAttendees"]:
-                FILTER["value"] = int(FILTER["value"])
-            formatted_query = ndb.query.FilterNode(
-                FILTER["field"], FILTER["operator"], FILTER["value"])
-            q = q.filter(formatted_query)
-        return q
+        """Return the datastore query for the submitted filters, plus the
+        filters it leaves to be applied in-process.
+        """
+        filters = self._format_filters(request.filters)
+        # Only the filters on the most selective field go to the datastore,
+        # so any combination of filters works with one index per field
+        return query_planner.plan(Conference.query(), filters,
+                                  CONF_FILTER_SELECTIVITY, Conference.name)
+
+    @endpoints.method(SessionQueryForms,
+                      SessionForms,
+                      path='querySessions',
+                      http_method='POST',
+                      name='querySessions')
+    @instrument
+    def query_sessions(self, request):
+        """Query for sessions with any combination of filters, optionally
+        within one conference, one page at a time.
+        """
+        page_size = self._get_page_size(request.pageSize)
+        cursor = self._get_cursor(request.pageToken)
+        filters = self._format_filters(request.filters, SESS_FIELDS)
+        query = Session.query(
+            ancestor=self._get_conference_key(request.websafeConferenceKey)
+            if request.websafeConferenceKey else None)
+
+        # the most selective filter runs in the datastore, the others are
+        # applied while streaming, so several inequalities can be combined
+        query, residual = query_planner.plan(
+            query, filters, SESS_FILTER_SELECTIVITY, Session.name)
+        sessions, next_cursor, more = query_planner.fetch_page(
+            query, residual, page_size, start_cursor=cursor)
+        return SessionForms(
+            items=self._copy_sessions_to_forms(sessions),
+            nextPageToken=(next_cursor.urlsafe()
+                           if more and next_cursor else None))
 
     # - - - Session objects - - - - - - - - - - - - - - - - -
 
@@ -537,6 +1127,7 @@ class ConferenceApi(remote.Service):
                       path="getSessionsByDate/{websafeConferenceKey}/{date}",
                       http_method="GET",
                       name="getSessionsByDate")
+    @instrument
     def get_sessions_by_date(self, request):
         """ Return all sessions by date. """
         # Make sure that the user is authenticated
@@ -545,36 +1136,136 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException("Authorization required.")
 
         # Get conference key and filter on sessions
-        sessions = Session.query(
-            ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        c_key = self._get_conference_key(request.websafeConferenceKey)
         date = datetime.strptime(request.date[:10], "%Y-%m-%d").date()
         # Filter by date
-        sessions = sessions.filter(Session.date == date)
+        sessions = Session.query(ancestor=c_key).filter(Session.date == date)
         # Return SessionForm as Session
-        return SessionForms(
-            items=[self._copy_session_to_form(s) for s in sessions])
+        return cache.get_or_load(
+            c_key.urlsafe(), 'sessions date %s' % date, SessionForms,
+            lambda: SessionForms(
+                items=self._copy_sessions_to_forms(sessions)))
 
     # - - - - Speaker section - - - - - - - - - - - - - - - - - -
-    @endpoints.method(SESS_BY_SPEAKER_GET_REQUEST,
+    @endpoints.method(SPEAKER_GET_REQUEST,
                       SessionForms,
                       path="getSessionsBySpeaker/"
                            "{speakerKey}",
                       http_method="GET",
                       name="getSessionsBySpeaker")
+    @instrument
     def get_sessions_by_speaker(self, request):
         """
-        Given a speakerKey, return all sessions given by this particular
-        speakerKey, across all conferences.
+        Given a speakerKey, return the sessions given by this particular
+        speakerKey across all conferences, one page at a time.
         """
         # Make sure user is authenticated
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException("Authorization required.")
-        # Filter on speakerKey
-        sessions = Session.query(Session.speakerKey == request.speakerKey)
-        # Return a SessionForm as Session
+        sp_key = self._get_speaker_key(request.speakerKey)
+        page_size = self._get_page_size(request.pageSize)
+        cursor = self._get_cursor(request.pageToken)
+        # pages are cached per speaker, creating a session of the speaker
+        # invalidates them
+        return cache.get_or_load(
+            sp_key.urlsafe(),
+            'sessions page %s %d' % (request.pageToken or '', page_size),
+            SessionForms,
+            lambda: self._load_speaker_sessions_page(sp_key, page_size,
+                                                     cursor))
+
+    def _load_speaker_sessions_page(self, sp_key, page_size, cursor):
+        """Read a page of a speaker's sessions through the SpeakerSession
+        index; its keys map straight onto the session keys.
+        """
+        links, next_cursor, more = SpeakerSession.query(
+            SpeakerSession.speaker == sp_key).fetch_page(
+                page_size, start_cursor=cursor, keys_only=True)
+        sessions = ndb.get_multi([ndb.Key(Session, link.id(),
+                                          parent=link.parent())
+                                  for link in links])
         return SessionForms(
-            items=[self._copy_session_to_form(s) for s in sessions])
+            items=self._copy_sessions_to_forms(
+                [session for session in sessions if session]),
+            nextPageToken=(next_cursor.urlsafe()
+                           if more and next_cursor else None))
+
+    @endpoints.method(SPEAKER_BY_CONFERENCE_GET_REQUEST,
+                      SpeakerForms,
+                      path="conference/{websafeConferenceKey}/speakers",
+                      http_method="GET",
+                      name="getSpeakersByConference")
+    @instrument
+    def get_speakers_by_conference(self, request):
+        """ Given a conference, return the speakers of its sessions """
+        c_key = self._get_conference_key(request.websafeConferenceKey)
+        return cache.get_or_load(c_key.urlsafe(), 'speakers', SpeakerForms,
+                                 lambda: self._load_speakers_form(c_key))
+
+    def _load_speakers_form(self, c_key):
+        """Read the speakers of a conference; the conference's speaker
+        index has one entry per speaker, keyed by the speaker's key.
+        """
+        entries = SpeakerSessionCount.query(ancestor=c_key).fetch(
+            keys_only=True)
+        speakers = ndb.get_multi([ndb.Key(urlsafe=entry.id())
+                                  for entry in entries])
+        return SpeakerForms(
+            items=[self._copy_speaker_to_form(speaker)
+                   for speaker in speakers if speaker])
+
+    @staticmethod
+    def _index_speaker_sessions(websafe_cursor=None):
+        """Build the speaker indexes of a batch of conferences from their
+        existing sessions; chains another task until all are indexed.
+        """
+        c_keys, next_cursor = fetch_batch(
+            Conference.query(), SPEAKER_INDEX_BATCH_SIZE, websafe_cursor,
+            keys_only=True)
+        for c_key in c_keys:
+            speakers = ConferenceApi._index_conference_speakers(c_key)
+            for speaker in speakers:
+                cache.invalidate(speaker)
+            if speakers:
+                cache.invalidate(c_key.urlsafe())
+
+        chain_batch('/tasks/index_speaker_sessions', next_cursor)
+
+    @staticmethod
+    @ndb.transactional()
+    def _index_conference_speakers(c_key):
+        """Rebuild a conference's SpeakerSession links and SpeakerSessionCount
+        entries from all of its sessions, in the conference's entity group so
+        sessions created meanwhile can't be missed; returns the speakers'
+        websafe keys. Sessions whose speakerKey isn't a Speaker are skipped.
+        """
+        by_speaker = {}
+        for session in Session.query(ancestor=c_key):
+            if not session.speakerKey:
+                continue
+            try:
+                ConferenceApi._get_speaker_key(session.speakerKey)
+            except endpoints.BadRequestException:
+                continue
+            by_speaker.setdefault(session.speakerKey, []).append(session)
+        ndb.put_multi(
+            [ConferenceApi._get_speaker_session(session)
+             for sessions in by_speaker.values() for session in sessions] +
+            [SpeakerSessionCount(
+                key=ndb.Key(SpeakerSessionCount, speaker, parent=c_key),
+                count=len(sessions),
+                sessionNames=[session.name for session in sessions])
+             for speaker, sessions in by_speaker.items()])
+        return list(by_speaker)
+
+    @staticmethod
+    def _get_speaker_session(session):
+        """Return the SpeakerSession linking a session to its speaker."""
+        return SpeakerSession(
+            key=ndb.Key(SpeakerSession, session.key.id(),
+                        parent=session.key.parent()),
+            speaker=ndb.Key(urlsafe=session.speakerKey))
 
     @endpoints.method(SESS_BY_TYPE_GET_REQUEST,
                       SessionForms,
@@ -582,6 +1273,7 @@ class ConferenceApi(remote.Service):
                            "{websafeConferenceKey}/{typeOfSession}",
                       http_method="GET",
                       name="getSessionsByType")
+    @instrument
     def get_sessions_by_type(self, request):
         """
         Given a conference, return all sessions of a specified type
@@ -593,18 +1285,22 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException("Authorization required.")
 
         # Query for session keys
-        s_key = Session.query(
-            ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        c_key = self._get_conference_key(request.websafeConferenceKey)
         # Filter on type of session
-        sessions = s_key.filter(Session.typeOfSession == request.typeOfSession)
-        return SessionForms(
-            items=[self._copy_session_to_form(s) for s in sessions])
-
-    @endpoints.method(CONF_GET_REQUEST,
+        sessions = Session.query(ancestor=c_key).filter(
+            Session.typeOfSession == request.typeOfSession)
+        return cache.get_or_load(
+            c_key.urlsafe(), 'sessions type %s' % request.typeOfSession,
+            SessionForms,
+            lambda: SessionForms(
+                items=self._copy_sessions_to_forms(sessions)))
+
+    @endpoints.method(CONF_READ_REQUEST,
                       SessionForms,
                       path="sessions/{websafeConferenceKey}",
                       http_method="GET",
                       name="getSessions")
+    @instrument
     def get_sessions(self, request):
         """ Given a conference, return all sessions """
         user = endpoints.get_current_user()
@@ -614,33 +1310,39 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException("Authorization required")
 
         # Try to get the Conference key
-        try:
-            c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        except Exception:
-            raise endpoints.BadRequestException(
-                "websafeConferenceKey is not valid.")
-        conf = c_key.get()
+        c_key = self._get_conference_key(request.websafeConferenceKey)
+        etag = cache.get_etag([c_key.urlsafe()])
+        if etag == self._get_if_none_match(request):
+            return SessionForms(etag=etag, notModified=True)
+        sessions = cache.get_or_load(
+            c_key.urlsafe(), 'sessions', SessionForms,
+            lambda: self._load_sessions_form(c_key))
+        sessions.etag = etag
+        return sessions
+
+    def _load_sessions_form(self, c_key):
+        """Read all sessions of a conference from the datastore."""
+        # the conference get and the sessions query run in parallel
+        conf, sessions = self._get_conference_and_sessions_async(
+            c_key).get_result()
         # Check if the conference exists
         if not conf:
             raise endpoints.NotFoundException(
                 "Could not find corresponding key to conference."
-                " Key: {}".format(request.websafeConferenceKey))
-        # Get the conferences sessions
-        sessions = Session.query(ancestor=c_key)
+                " Key: {}".format(c_key.urlsafe()))
         # Return a SessionForm for a Session
         return SessionForms(
-            items=[self._copy_session_to_form(sess) for sess in sessions])
+            items=self._copy_sessions_to_forms(sessions))
 
-    def _create_session_object(self, request):
-        """ Create session object """
-        global speaker
-        user = endpoints.get_current_user()
-        # Auth the user
-        if not user:
-            raise endpoints.UnauthorizedException("Authorization required")
-
-        user_id = getUserId(user)
+    @ndb.tasklet
+    def _get_conference_and_sessions_async(self, c_key):
+        """Fetch a conference and all of its sessions concurrently."""
+        conf, sessions = yield (c_key.get_async(),
+                                Session.query(ancestor=c_key).fetch_async())
+        raise ndb.Return(conf, sessions)
 
+    def _get_session_data(self, request):
+        """Validate a SessionForm and turn it into Session properties."""
         if not request.name:
             raise endpoints.BadRequestException(
                 "Session 'name' field required")
@@ -649,27 +1351,6 @@ class ConferenceApi(remote.Service):
             raise endpoints.BadRequestException(
                 "Session 'date' field required")
 
-        # We are going to need information from the Conference the session
-        # belongs to.
-        try:
-            c_key = ndb.Key(urlsafe=request.parentConference)
-        except Exception:
-            raise endpoints.BadRequestException("Parent conference is invalid")
-
-        conference = c_key.get()
-        # Check that the current user is the same who created the conference
-        if user_id != conference.organizerUserId:
-            raise endpoints.ForbiddenException(
-                "You have to be the creator of the conference to create a"
-                " session")
-        # Check if the speakerKey is valid
-        if request.speakerKey:
-            try:
-                speaker = ndb.Key(urlsafe=request.speakerKey).get()
-            except Exception:
-                raise endpoints.BadRequestException(
-                    "speakerKey {} is not valid.".format(request.speakerKey))
-
         # Copy SessionForm/ProtoRPC Message into dict.
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
@@ -690,53 +1371,211 @@ class ConferenceApi(remote.Service):
         # Convert typOfSession to string
         if data['typeOfSession']:
             data['typeOfSession'] = str(data['typeOfSession'])
+        return data
 
-        p_key = ndb.Key(Profile, user_id)
-        s_id = Session.allocate_ids(size=1, parent=c_key)[0]
+    @staticmethod
+    def _get_speaker_key(speaker_websafekey):
+        """Return the Speaker key for a speakerKey."""
+        try:
+            sp_key = ndb.Key(urlsafe=speaker_websafekey)
+        except Exception:
+            raise endpoints.BadRequestException(
+                "speakerKey {} is not valid.".format(speaker_websafekey))
+        if sp_key.kind() != Speaker._get_kind():
+            raise endpoints.BadRequestException(
+                "speakerKey {} is not valid.".format(speaker_websafekey))
+        return sp_key
+
+    def _create_session_object(self, request):
+        """ Create session object """
+        user = endpoints.get_current_user()
+        # Auth the user
+        if not user:
+            raise endpoints.UnauthorizedException("Authorization required")
+
+        user_id = getUserId(user)
+        data = self._get_session_data(request)
+
+        # We are going to need information from the Conference the session
+        # belongs to.
+        try:
+            c_key = ndb.Key(urlsafe=request.parentConference)
+        except Exception:
+            raise endpoints.BadRequestException("Parent conference is invalid")
+        speaker_key = (self._get_speaker_key(request.speakerKey)
+                       if request.speakerKey else None)
+
+        # The conference, the speaker and the new session id don't depend on
+        # each other, so run those RPCs in parallel
+        conference_future = c_key.get_async()
+        speaker_future = speaker_key.get_async() if speaker_key else None
+        ids_future = Session.allocate_ids_async(size=1, parent=c_key)
+
+        conference = conference_future.get_result()
+        if not conference:
+            raise endpoints.NotFoundException(
+                "No conference found with key: {}".format(
+                    request.parentConference))
+        # Check that the current user is the same who created the conference
+        if user_id != conference.organizerUserId:
+            raise endpoints.ForbiddenException(
+                "You have to be the creator of the conference to create a"
+                " session")
+        # Check if the speakerKey is valid
+        if speaker_future and not speaker_future.get_result():
+            raise endpoints.BadRequestException(
+                "speakerKey {} is not valid.".format(request.speakerKey))
+
+        s_id = ids_future.get_result()[0]
         s_key = ndb.Key(Session, s_id, parent=c_key)
         data['key'] = s_key
-        # TODO: add to taskqueue
-        taskqueue.add(params={'conference_key': conference.key.urlsafe(),
-                              'speaker_key': request.speakerKey},
-                      url='/tasks/set_featured_speaker')
-        Session(**data).put()
-        # return request
-        return self._copy_session_to_form(s_key.get())
+        session = Session(**data)
+        self._put_sessions([session])
+        cache.invalidate(c_key.urlsafe())
+        search_index.schedule_update(s_key)
+        # the stored entity is the one we already hold
+        return self._copy_session_to_form(session)
+
+    def _create_session_objects(self, request):
+        """Create a batch of sessions of one conference."""
+        user = endpoints.get_current_user()
+        # Auth the user
+        if not user:
+            raise endpoints.UnauthorizedException("Authorization required")
+        user_id = getUserId(user)
+
+        if not request.items:
+            raise endpoints.BadRequestException("No sessions given.")
+        if len(request.items) > MAX_BULK_SESSIONS:
+            raise endpoints.BadRequestException(
+                "At most {} sessions can be created at once.".format(
+                    MAX_BULK_SESSIONS))
+        c_key = self._get_conference_key(request.websafeConferenceKey)
+        wsck = c_key.urlsafe()
+        for form in request.items:
+            if form.parentConference not in (None, wsck):
+                raise endpoints.BadRequestException(
+                    "All sessions must belong to conference {}.".format(wsck))
+        data = [self._get_session_data(form) for form in request.items]
+        speaker_keys = dict(
+            (speaker, self._get_speaker_key(speaker))
+            for speaker in set(form.speakerKey for form in request.items)
+            if speaker)
+
+        # Validate the conference once, load every speaker at once and
+        # allocate all the ids in one go, in parallel
+        conference_future = c_key.get_async()
+        speaker_futures = ndb.get_multi_async(speaker_keys.values())
+        ids_future = Session.allocate_ids_async(size=len(data), parent=c_key)
+
+        conference = conference_future.get_result()
+        if not conference:
+            raise endpoints.NotFoundException(
+                "No conference found with key: {}".format(wsck))
+        # Check that the current user is the same who created the conference
+        if user_id != conference.organizerUserId:
+            raise endpoints.ForbiddenException(
+                "You have to be the creator of the conference to create a"
+                " session")
+        for speaker, future in zip(speaker_keys, speaker_futures):
+            if not future.get_result():
+                raise endpoints.BadRequestException(
+                    "speakerKey {} is not valid.".format(speaker))
+
+        first_id, last_id = ids_future.get_result()
+        sessions = []
+        for s_id, entry in zip(range(first_id, last_id + 1), data):
+            entry['key'] = ndb.Key(Session, s_id, parent=c_key)
+            entry['parentConference'] = wsck
+            sessions.append(Session(**entry))
+        self._put_sessions(sessions)
+        cache.invalidate(wsck)
+        search_index.schedule_updates([session.key for session in sessions])
+        return SessionForms(items=self._copy_sessions_to_forms(sessions))
+
+    @staticmethod
+    @ndb.transactional()
+    def _put_sessions(sessions):
+        """Store new sessions of one conference, link them to their speakers,
+        count them in its speaker index and bump the conference's version;
+        all of it lives in the conference's entity group. Each speaker's
+        featured speaker update is queued once the sessions are committed.
+        """
+        by_speaker = {}
+        for session in sessions:
+            if session.speakerKey:
+                by_speaker.setdefault(session.speakerKey, []).append(session)
+        c_key = sessions[0].key.parent()
+        conf = c_key.get()
+        conf.version += 1
+        ndb.put_multi([conf] + sessions + [
+            ConferenceApi._get_speaker_session(session)
+            for session in sessions if session.speakerKey])
+        if not by_speaker:
+            return
+        for speaker in by_speaker:
+            cache.invalidate(speaker)
+        # named tasks can't be transactional, so they are added on commit
+        ndb.get_context().call_on_commit(
+            lambda: ConferenceApi._schedule_featured_speakers(
+                c_key.urlsafe(), list(by_speaker)))
+        index_keys = [ndb.Key(SpeakerSessionCount, speaker, parent=c_key)
+                      for speaker in by_speaker]
+        indexes = ndb.get_multi(index_keys)
+        # first indexed sessions of a speaker here; pick up the sessions
+        # stored before the index existed (the queries don't see the
+        # sessions put in this transaction)
+        earlier = dict(
+            (index_key.id(), Session.query(ancestor=c_key).filter(
+                Session.speakerKey == index_key.id()).fetch_async())
+            for index_key, index in zip(index_keys, indexes) if not index)
+        for i, index_key in enumerate(index_keys):
+            speaker = index_key.id()
+            if not indexes[i]:
+                found = earlier[speaker].get_result()
+                indexes[i] = SpeakerSessionCount(
+                    key=index_key, count=len(found),
+                    sessionNames=[sess.name for sess in found])
+            indexes[i].count += len(by_speaker[speaker])
+            indexes[i].sessionNames.extend(
+                sess.name for sess in by_speaker[speaker])
+        ndb.put_multi(indexes)
 
     def _copy_session_to_form(self, sess):
         """Copy relevant fields from Session to SessionForm."""
-        sf = SessionForm()
-        for field in sf.all_fields():
-            if hasattr(sess, field.name):
-                # convert date to date string; just copy others
-                if field.name == 'date' or field.name == "startTime":
-                    setattr(sf, field.name, str(getattr(sess, field.name)))
-                # Convert typeOfSession to enum
-                elif field.name == "typeOfSession":
-                    setattr(sf, field.name,
-                            getattr(TypeOfSession, getattr(sess, field.name)))
-                else:
-                    setattr(sf, field.name, getattr(sess, field.name))
-            if field.name == "websafeSessionKey":
-                setattr(sf, field.name, sess.key.urlsafe())
-        sf.check_initialized()
-        return sf
+        return serializers.to_form(sess, SessionForm)
+
+    def _copy_sessions_to_forms(self, sessions):
+        """Copy a list of Sessions to SessionForms."""
+        return serializers.to_forms(sessions, SessionForm, Session)
 
     @endpoints.method(SessionForm,
                       SessionForm,
                       path="session",
                       http_method="POST",
                       name="createSession")
+    @instrument
     def create_session(self, request):
         """ Create new session """
         return self._create_session_object(request)
 
+    @endpoints.method(SESSIONS_POST_REQUEST,
+                      SessionForms,
+                      path="conference/{websafeConferenceKey}/sessions",
+                      http_method="POST",
+                      name="createSessions")
+    @instrument
+    def create_sessions(self, request):
+        """ Create many sessions of one conference in a single call """
+        return self._create_session_objects(request)
+
     # - - - Profile objects - - - - - - - - - - - - - - - - - - -
     @endpoints.method(message_types.VoidMessage,
                       ProfileForm,
                       path='profile',
                       http_method='GET',
                       name='getProfile')
+    @instrument
     def get_profile(self, request):
         """Return user profile."""
         return self._do_profile()
@@ -746,28 +1585,36 @@ class ConferenceApi(remote.Service):
                       path='profile',
                       http_method='POST',
                       name='saveProfile')
+    @instrument
     def save_profile(self, request):
         """Update & return user profile."""
         return self._do_profile(request)
 
-    def _copy_profile_to_form(self, prof):
-        """Copy relevant fields from Profile to ProfileForm."""
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name,
-                            getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
+    def _copy_profile_to_form(self, prof, registration_keys=None):
+        """Copy relevant fields from Profile to ProfileForm; pass the
+        profile's Registration keys when they were already fetched.
+        """
+        pf = serializers.to_form(prof, ProfileForm)
+        # registrations live in their own entities, ids are the conference
+        # websafe keys
+        if registration_keys is None:
+            registration_keys = Registration.query(
+                ancestor=prof.key).fetch(keys_only=True)
+        pf.conferenceKeysToAttend = [r_key.id()
+                                     for r_key in registration_keys]
         return pf
 
     def _get_profile_from_user(self):
         """
         Return user Profile from datastore, creating new one if non-existent.
         """
+        return self._get_profile_from_user_async().get_result()
+
+    @ndb.tasklet
+    def _get_profile_from_user_async(self):
+        """Tasklet version of _get_profile_from_user(), so the profile can
+        be fetched alongside other independent RPCs.
+        """
         # Make sure user is authenticated
         user = endpoints.get_current_user()
         if not user:
@@ -776,21 +1623,22 @@ class ConferenceApi(remote.Service):
         # get Profile from datastore
         user_id = getUserId(user)
         p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
+        profile = yield p_key.get_async()
         # create new Profile if not there
         if not profile:
             profile = Profile(key=p_key,
                               displayName=user.nickname(),
                               mainEmail=user.email(),
                               teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED), )
-            profile.put()
+            yield profile.put_async()
 
-        return profile  # return Profile
+        raise ndb.Return(profile)  # return Profile
 
     def _do_profile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
         # get user Profile
         prof = self._get_profile_from_user()
+        display_name = prof.displayName
 
         # if save_profile(), process user-modifiable fields
         if save_request:
@@ -805,18 +1653,181 @@ class ConferenceApi(remote.Service):
                             setattr(prof, field, val)
                     prof.put()
 
+            # conferences carry a copy of their organizer's display name,
+            # rewrite them in the background when it changes
+            if prof.displayName != display_name:
+                taskqueue.add(params={'user_id': prof.key.id()},
+                              url='/tasks/update_organizer_display_name')
+
         # return ProfileForm
         return self._copy_profile_to_form(prof)
 
+    @staticmethod
+    def _update_organizer_display_name(user_id, websafe_cursor=None):
+        """Copy the organizer's current display name onto a batch of their
+        conferences; chains another task until all of them are rewritten.
+        """
+        p_key = ndb.Key(Profile, user_id)
+        prof = p_key.get()
+        if not prof:
+            return
+        conferences, next_cursor = fetch_batch(
+            Conference.query(ancestor=p_key), ORGANIZER_UPDATE_BATCH_SIZE,
+            websafe_cursor)
+        for conf in conferences:
+            if conf.organizerDisplayName != prof.displayName:
+                ConferenceApi._set_organizer_display_name(
+                    conf.key, prof.displayName)
+
+        chain_batch('/tasks/update_organizer_display_name', next_cursor,
+                    user_id=user_id)
+
+    @staticmethod
+    def _backfill_organizer_display_names(websafe_cursor=None):
+        """Copy their organizer's display name onto a batch of conferences
+        stored without one; chains another task until all are done.
+        """
+        conferences, next_cursor = fetch_batch(
+            Conference.query(), ORGANIZER_UPDATE_BATCH_SIZE, websafe_cursor)
+        missing = [conf for conf in conferences
+                   if conf.organizerDisplayName is None]
+        profiles = ndb.get_multi([conf.key.parent() for conf in missing])
+        for conf, prof in zip(missing, profiles):
+            if prof:
+                ConferenceApi._set_organizer_display_name(
+                    conf.key, prof.displayName)
+
+        chain_batch('/tasks/backfill_organizer_display_names', next_cursor)
+
+    @staticmethod
+    @ndb.transactional()
+    def _set_organizer_display_name(c_key, display_name):
+        """Copy a display name onto a freshly read conference, so seat
+        changes made since it was queried are kept.
+        """
+        conf = c_key.get()
+        if conf and conf.organizerDisplayName != display_name:
+            conf.organizerDisplayName = display_name
+            conf.version += 1
+            conf.put()
+            cache.invalidate(c_key.urlsafe())
+            # the search document indexes the organizer's name too
+            search_index.schedule_update(c_key, transactional=True)
+
+    # - - - Dashboard - - - - - - - - - - - - - - - - - - - - - -
+    @endpoints.method(message_types.VoidMessage,
+                      DashboardForm,
+                      path='dashboard',
+                      http_method='GET',
+                      name='getDashboard')
+    @instrument
+    def get_dashboard(self, request):
+        """Return the profile, conferences to attend, a wishlist summary
+        and the announcements in one call.
+        """
+        return self._get_dashboard_async().get_result()
+
+    @ndb.tasklet
+    def _get_dashboard_async(self):
+        """Fetch every part of the dashboard concurrently."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        p_key = ndb.Key(Profile, getUserId(user))
+        ctx = ndb.get_context()
+
+        # all independent reads go out at once; the context batches both
+        # memcache gets into one RPC
+        wishlist = WishlistEntry.query(ancestor=p_key)
+        prof, r_keys, w_keys, wishlist_count, announcement, featured = \
+            yield (self._get_profile_from_user_async(),
+                   Registration.query(ancestor=p_key).fetch_async(
+                       keys_only=True),
+                   wishlist.fetch_async(DASHBOARD_WISHLIST_SIZE,
+                                        keys_only=True),
+                   wishlist.count_async(),
+                   ctx.memcache_get(MEMCACHE_ANNOUNCEMENTS_KEY),
+                   ctx.memcache_get(MEMCACHE_FEATURED_SPEAKER_KEY))
+
+        # the key ids are the websafe keys of the conferences and sessions,
+        # read them all in one batch get
+        c_keys = [ndb.Key(urlsafe=r_key.id()) for r_key in r_keys]
+        s_keys = [ndb.Key(urlsafe=w_key.id()) for w_key in w_keys]
+        entities = yield ndb.get_multi_async(c_keys + s_keys)
+        conferences = [conf for conf in entities[:len(c_keys)] if conf]
+        sessions = [sess for sess in entities[len(c_keys):] if sess]
+
+        raise ndb.Return(DashboardForm(
+            profile=self._copy_profile_to_form(prof, r_keys),
+            conferencesToAttend=self._copy_conferences_to_forms(conferences),
+            wishlist=self._copy_sessions_to_forms(sessions),
+            wishlistCount=wishlist_count,
+            announcement=announcement or "",
+            featuredSpeaker=featured or ""))
+
     # - - - Announcements - - - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _is_nearly_sold_out(seats_available):
+        """Tell whether a conference with this many free seats belongs in
+        the announcement.
+        """
+        return 0 < seats_available <= NEARLY_SOLD_OUT_SEATS
+
+    @staticmethod
+    def _update_nearly_sold_out(conf):
+        """Bring conf.nearlySoldOut in line with its seatsAvailable; the
+        caller puts the conference. When the flag changes, the announcement
+        is rebuilt once the surrounding transaction commits. Returns whether
+        the flag changed.
+        """
+        nearly_sold_out = ConferenceApi._is_nearly_sold_out(
+            conf.seatsAvailable)
+        if conf.nearlySoldOut == nearly_sold_out:
+            return False
+        conf.nearlySoldOut = nearly_sold_out
+        ndb.get_context().call_on_commit(
+            ConferenceApi._schedule_announcement)
+        return True
+
+    @staticmethod
+    def _schedule_announcement():
+        """Queue a rebuild of the announcement for the end of the current
+        debounce window; all changes within one window share a task.
+        """
+        add_bucketed_task('announcement', ANNOUNCEMENT_DEBOUNCE_SECONDS,
+                          url='/tasks/set_announcement')
+
+    @staticmethod
+    def _reconcile_nearly_sold_out():
+        """Fix the conferences whose nearlySoldOut flag disagrees with
+        their seatsAvailable, e.g. sharded conferences, whose seat count is
+        only copied back by seats.reconcile_seats_available(), and those
+        written before the flag existed.
+        """
+        flagged = set(Conference.query(
+            Conference.nearlySoldOut == True).iter(keys_only=True))
+        in_range = set(Conference.query(ndb.AND(
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+            Conference.seatsAvailable > 0)).iter(keys_only=True))
+        for c_key in flagged ^ in_range:
+            ConferenceApi._reconcile_conference(c_key)
+
+    @staticmethod
+    @ndb.transactional()
+    def _reconcile_conference(c_key):
+        """Fix one conference's nearlySoldOut flag."""
+        conf = c_key.get()
+        if conf and ConferenceApi._update_nearly_sold_out(conf):
+            conf.put()
+
     @staticmethod
     def _cache_announcement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
+        """Create Announcement & assign to memcache; used by the
+        debounced announcement task and the reconciliation cron job.
         """
         conferences = Conference.query(
-            ndb.AND(Conference.seatsAvailable <= 5, Conference.seatsAvailable >
-                    0)).fetch(projection=[Conference.name])
+            Conference.nearlySoldOut == True).fetch(
+                projection=[Conference.name])
 
         if conferences:
             # If there are almost sold out conferences,
@@ -836,7 +1847,8 @@ class ConferenceApi(remote.Service):
                       path='conference/announcement/get',
                       http_method='GET',
                       name='getAnnouncement')
-    def get_announcement(self):
+    @instrument
+    def get_announcement(self, request):
         """Return Announcement from memcache."""
         return StringMessage(
             data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
@@ -845,12 +1857,18 @@ class ConferenceApi(remote.Service):
     @ndb.transactional(xg=True)
     def _conference_registration(self, request, reg=True):
         """Register or unregister user for selected conference."""
-        prof = self._get_profile_from_user()  # get user Profile
-
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
         wsck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=wsck).get()
+        # get user Profile and conference in parallel, then check the
+        # registration with a single key get
+        prof_future = self._get_profile_from_user_async()
+        conf_future = ndb.Key(urlsafe=wsck).get_async()
+        r_key = self._get_registration_key(
+            prof_future.get_result().key, wsck)
+        registration_future = r_key.get_async()
+        conf = conf_future.get_result()
+        registration = registration_future.get_result()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
@@ -858,68 +1876,129 @@ class ConferenceApi(remote.Service):
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException("There are no seats available.")
-
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
+            # check if seats avail and take one away; sharded conferences
+            # take it from one of their shards instead
+            if conf.seatShards:
+                if not seats.reserve_seat(conf):
+                    raise ConflictException("There are no seats available.")
+            else:
+                if conf.seatsAvailable <= 0:
+                    raise ConflictException("There are no seats available.")
+                conf.seatsAvailable -= 1
+                self._update_nearly_sold_out(conf)
+                conf.version += 1
+                conf.put()
+
+            # register user
+            Registration(key=r_key, conferenceKey=conf.key).put()
             return_value = True
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
 
                 # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
+                r_key.delete()
+                if conf.seatShards:
+                    seats.release_seat(conf)
+                else:
+                    conf.seatsAvailable += 1
+                    self._update_nearly_sold_out(conf)
+                    conf.version += 1
+                    conf.put()
                 return_value = True
             else:
                 return_value = False
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
+        if return_value:
+            cache.invalidate(conf.key.urlsafe())
+            cache.invalidate(r_key.parent().urlsafe())
         return BooleanMessage(data=return_value)
 
-    @endpoints.method(message_types.VoidMessage,
+    @endpoints.method(ATTENDING_GET_REQUEST,
                       ConferenceForms,
                       path='conferences/attending',
                       http_method='GET',
                       name='getConferencesToAttend')
+    @instrument
     def get_conferences_to_attend(self, request):
-        """Get list of conferences that user has registered for."""
-        prof = self._get_profile_from_user()  # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck)
-                     for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
-
-        # get organizers
-        organizers = [ndb.Key(Profile, conf.organizerUserId)
-                      for conf in conferences]
-        profiles = ndb.get_multi(organizers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        """Get list of conferences that user has registered for; only an
+        ETag when the client's copy is still current.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        p_key = ndb.Key(Profile, getUserId(user))
+        wsp = p_key.urlsafe()
+
+        # the ETag covers the user's registrations and every conference
+        # they attend, so both come from memcache while nothing changes
+        wscks = cache.get_or_load_value(
+            wsp, 'attending keys', lambda: [
+                r_key.id() for r_key in
+                Registration.query(ancestor=p_key).fetch(keys_only=True)])
+        etag = cache.get_etag([wsp] + wscks)
+        if etag == self._get_if_none_match(request):
+            return ConferenceForms(etag=etag, notModified=True)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[
-            self._copy_conference_to_form(conf, names[
-                conf.organizerUserId]) for conf in conferences])
+        conferences = cache.get_or_load(
+            wsp, 'attending %s' % etag, ConferenceForms,
+            lambda: ConferenceForms(items=self._copy_conferences_to_forms(
+                ndb.get_multi([ndb.Key(urlsafe=wsck) for wsck in wscks]))))
+        conferences.etag = etag
+        return conferences
+
+    @staticmethod
+    def _get_registration_key(p_key, wsck):
+        """Return the key of a profile's registration for a conference."""
+        return ndb.Key(Registration, wsck, parent=p_key)
+
+    @staticmethod
+    def _migrate_registrations(websafe_cursor=None):
+        """Move a batch of profiles' conferenceKeysToAttend lists into
+        Registration entities; chains another task until all profiles are
+        done. Registration keys are deterministic, so reruns are harmless.
+        """
+        profiles, next_cursor = fetch_batch(
+            Profile.query(), REGISTRATION_MIGRATION_BATCH_SIZE, websafe_cursor)
+        for prof in profiles:
+            if prof.conferenceKeysToAttend:
+                ConferenceApi._migrate_profile_registrations(prof.key)
+
+        chain_batch('/tasks/migrate_registrations', next_cursor)
+
+    @staticmethod
+    @ndb.transactional()
+    def _migrate_profile_registrations(p_key):
+        """Move one profile's conferenceKeysToAttend list into Registration
+        entities; they share the profile's entity group, so concurrent
+        profile saves and registrations are not lost.
+        """
+        prof = p_key.get()
+        if not prof or not prof.conferenceKeysToAttend:
+            return
+        r_keys = [ConferenceApi._get_registration_key(p_key, wsck)
+                  for wsck in set(prof.conferenceKeysToAttend)]
+        ndb.put_multi([
+            Registration(key=r_key, conferenceKey=ndb.Key(urlsafe=r_key.id()))
+            for r_key, registration in zip(r_keys, ndb.get_multi(r_keys))
+            if not registration])
+        prof.conferenceKeysToAttend = []
+        prof.put()
+        cache.invalidate(p_key.urlsafe())
 
     @endpoints.method(CONF_GET_REQUEST,
                       BooleanMessage,
                       path='conference/{websafeConferenceKey}',
                       http_method='POST',
                       name='registerForConference')
+    @instrument
     def register_for_conference(self, request):
         """Register user for selected conference."""
         return self._conference_registration(request)
@@ -929,16 +2008,259 @@ class ConferenceApi(remote.Service):
                       path='conference/{websafeConferenceKey}',
                       http_method='DELETE',
                       name='unregisterFromConference')
+    @instrument
     def unregister_from_conference(self, request):
         """Unregister user for selected conference."""
         return self._conference_registration(request, reg=False)
 
+    # - - - Attendee roster - - - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _get_organized_conference_key(wsck, user_id):
+        """Return the key of a conference, making sure the user organizes
+        it.
+        """
+        c_key = ConferenceApi._get_conference_key(wsck)
+        conf = c_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the attendees.')
+        return c_key
+
+    @staticmethod
+    def _get_roster_page(c_key, page_size, cursor=None):
+        """Return (AttendeeForm list, next cursor, more) for one batch of a
+        conference's registrants, read through the Registration index.
+        """
+        registrations, next_cursor, more = Registration.query(
+            Registration.conferenceKey == c_key).fetch_page(
+                page_size, start_cursor=cursor)
+        profiles = ndb.get_multi([registration.key.parent()
+                                  for registration in registrations])
+        items = [AttendeeForm(displayName=prof.displayName,
+                              mainEmail=prof.mainEmail,
+                              teeShirtSize=prof.teeShirtSize,
+                              registered=str(registration.created))
+                 for registration, prof in zip(registrations, profiles)
+                 if prof]
+        return items, next_cursor, more
+
+    @endpoints.method(ROSTER_GET_REQUEST,
+                      AttendeeForms,
+                      path='conference/{websafeConferenceKey}/roster',
+                      http_method='GET',
+                      name='getConferenceRoster')
+    @instrument
+    def get_conference_roster(self, request):
+        """Return the attendees of a conference, one page at a time; only
+        for its organizer.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        c_key = self._get_organized_conference_key(
+            request.websafeConferenceKey, getUserId(user))
+        items, next_cursor, more = self._get_roster_page(
+            c_key, self._get_page_size(request.pageSize),
+            self._get_cursor(request.pageToken))
+        return AttendeeForms(
+            items=items,
+            nextPageToken=(next_cursor.urlsafe()
+                           if more and next_cursor else None))
+
+    # - - - Asynchronous registration - - - - - - - - - - - - - - - -
+    def _copy_ticket_to_form(self, ticket):
+        """Copy relevant fields from RegistrationTicket to its form."""
+        return RegistrationTicketForm(
+            ticketId=ticket.key.id(),
+            websafeConferenceKey=ticket.conferenceKey,
+            status=getattr(RegistrationStatus, ticket.status),
+            message=ticket.message)
+
+    @ndb.transactional()
+    def _enqueue_registration(self, ticket):
+        """Store the ticket and queue its intent in one transaction."""
+        ticket.put()
+        intent = {'user_id': ticket.key.parent().id(),
+                  'ticket_id': ticket.key.id()}
+        taskqueue.Queue(REGISTRATION_QUEUE).add(
+            taskqueue.Task(payload=json.dumps(intent), method='PULL',
+                           tag=ticket.conferenceKey),
+            transactional=True)
+
+    @endpoints.method(CONF_GET_REQUEST,
+                      RegistrationTicketForm,
+                      path='conference/{websafeConferenceKey}/registration',
+                      http_method='POST',
+                      name='requestConferenceRegistration')
+    @instrument
+    def request_conference_registration(self, request):
+        """Queue a registration for the selected conference and return a
+        ticket to poll with getRegistrationStatus.
+        """
+        # only queue intents the worker can act on
+        c_key = self._get_conference_key(request.websafeConferenceKey)
+        prof_future = self._get_profile_from_user_async()
+        conf_future = c_key.get_async()
+        prof = prof_future.get_result()
+        if not conf_future.get_result():
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % c_key.urlsafe())
+
+        ticket = RegistrationTicket(
+            key=ndb.Key(RegistrationTicket, uuid.uuid4().hex,
+                        parent=prof.key),
+            conferenceKey=c_key.urlsafe())
+        self._enqueue_registration(ticket)
+
+        # make sure a worker picks the intent up soon; a burst of requests
+        # only schedules one run
+        add_bucketed_task('process-registrations', REGISTRATION_KICK_INTERVAL,
+                          url='/tasks/process_registrations')
+        return self._copy_ticket_to_form(ticket)
+
+    @endpoints.method(TICKET_GET_REQUEST,
+                      RegistrationTicketForm,
+                      path='registration/{ticketId}',
+                      http_method='GET',
+                      name='getRegistrationStatus')
+    @instrument
+    def get_registration_status(self, request):
+        """Return the outcome of a queued registration."""
+        prof = self._get_profile_from_user()
+        ticket = ndb.Key(RegistrationTicket, request.ticketId,
+                         parent=prof.key).get()
+        if not ticket:
+            raise endpoints.NotFoundException(
+                'No registration found with ticket: %s' % request.ticketId)
+        return self._copy_ticket_to_form(ticket)
+
+    @staticmethod
+    def _process_registration_intents():
+        """Lease queued registration intents, one conference at a time, and
+        admit them in batched transactions.
+        """
+        queue = taskqueue.Queue(REGISTRATION_QUEUE)
+        for _ in range(REGISTRATION_LEASE_ROUNDS):
+            # without a tag this leases tasks sharing the oldest task's tag
+            tasks = queue.lease_tasks_by_tag(REGISTRATION_LEASE_SECONDS,
+                                             REGISTRATION_LEASE_SIZE)
+            if not tasks:
+                break
+            # a failing conference must not stall the others: its tasks
+            # stay leased, so the next round leases the next tag
+            try:
+                intents = [json.loads(task.payload) for task in tasks]
+                ConferenceApi._admit_registrations(tasks[0].tag, intents)
+            except Exception:
+                logging.exception('could not admit registrations for %s',
+                                  tasks[0].tag)
+                continue
+            queue.delete_tasks(tasks)
+
+    @staticmethod
+    def _admit_registrations(wsck, intents):
+        """Apply the registration intents for one conference."""
+        try:
+            conf = ConferenceApi._get_conference_key(wsck).get()
+        except endpoints.BadRequestException:
+            conf = None
+        if not conf:
+            ConferenceApi._reject_registrations(
+                intents, 'No conference found with key: %s' % wsck)
+            return
+        # every batch touches the conference (or its seat shards) plus one
+        # entity group per registrant
+        batch_size = XG_ENTITY_GROUP_LIMIT - 1 - conf.seatShards
+        for i in range(0, len(intents), batch_size):
+            ConferenceApi._admit_registration_batch(
+                wsck, intents[i:i + batch_size])
+
+    @staticmethod
+    def _reject_registrations(intents, message):
+        """Reject the pending tickets of intents that can't be admitted."""
+        tickets = [ticket for ticket in ndb.get_multi([
+            ndb.Key(Profile, intent['user_id'],
+                    RegistrationTicket, intent['ticket_id'])
+            for intent in intents])
+            if ticket and ticket.status == 'PENDING']
+        for ticket in tickets:
+            ticket.status = 'REJECTED'
+            ticket.message = message
+        ndb.put_multi(tickets)
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _admit_registration_batch(wsck, intents):
+        """Register a batch of users for a conference in one transaction."""
+        conf = ndb.Key(urlsafe=wsck).get()
+        t_keys = [ndb.Key(Profile, intent['user_id'],
+                          RegistrationTicket, intent['ticket_id'])
+                  for intent in intents]
+        tickets = [ticket for ticket in ndb.get_multi(t_keys)
+                   if ticket and ticket.status == 'PENDING']
+        p_keys = list(set(t.key.parent() for t in tickets))
+        r_keys = [ConferenceApi._get_registration_key(p_key, wsck)
+                  for p_key in p_keys]
+        entities = ndb.get_multi(p_keys + r_keys)
+        profiles = dict((prof.key, prof)
+                        for prof in entities[:len(p_keys)] if prof)
+        registered = set(registration.key.parent()
+                         for registration in entities[len(p_keys):]
+                         if registration)
+
+        # tickets of users that may still take a seat, first come first served
+        candidates = []
+        seen = set()
+        for ticket in tickets:
+            prof = profiles.get(ticket.key.parent())
+            ticket.status = 'REJECTED'
+            if not conf:
+                ticket.message = 'No conference found with key: %s' % wsck
+            elif not prof:
+                ticket.message = 'No profile found for this registration.'
+            elif prof.key in registered or prof.key in seen:
+                ticket.message = \
+                    'You have already registered for this conference'
+            else:
+                candidates.append((ticket, prof))
+                seen.add(prof.key)
+
+        # take as many seats as there are candidates
+        admitted = []
+        if candidates:
+            if conf.seatShards:
+                available = seats.take_seats(conf, len(candidates))
+            else:
+                available = max(0, min(conf.seatsAvailable, len(candidates)))
+                if available:
+                    conf.seatsAvailable -= available
+                    ConferenceApi._update_nearly_sold_out(conf)
+                    conf.version += 1
+                    conf.put()
+            for ticket, prof in candidates[:available]:
+                admitted.append(Registration(
+                    key=ConferenceApi._get_registration_key(prof.key, wsck),
+                    conferenceKey=conf.key))
+                ticket.status = 'REGISTERED'
+                ticket.message = None
+                cache.invalidate(prof.key.urlsafe())
+            for ticket, prof in candidates[available:]:
+                ticket.message = 'There are no seats available.'
+            if available:
+                cache.invalidate(wsck)
+
+        ndb.put_multi(tickets + admitted)
+
     @endpoints.method(message_types.VoidMessage,
                       ConferenceForms,
                       path='filterPlayground',
                       http_method='GET',
                       name='filterPlayground')
-    def filter_playground(self):
+    @instrument
+    def filter_playground(self, request):
         """Filter Playground"""
         q = Conference.query()
         q = q.filter(Conference.city == "London")
@@ -946,7 +2268,7 @@ class ConferenceApi(remote.Service):
         q = q.filter(Conference.month == 6)
 
         return ConferenceForms(
-            items=[self._copy_conference_to_form(conf, "") for conf in q])
+            items=self._copy_conferences_to_forms(q))
 
     # - - - - Featured Speakers objects - - - - - - - - - - - - - - - - - -
     @staticmethod
@@ -956,32 +2278,55 @@ class ConferenceApi(remote.Service):
         # Get the speaker and conference keys
         conference_key = ndb.Key(urlsafe=conference_websafekey)
         speaker_key = ndb.Key(urlsafe=speaker_websafekey)
-        sessions = Session.query(ancestor=conference_key).filter(
-            Session.speakerKey == speaker_key.urlsafe())
+        index_key = ndb.Key(SpeakerSessionCount, speaker_websafekey,
+                            parent=conference_key)
+
+        # The speaker index already holds the session count and names
+        index, conference, speaker = ndb.get_multi(
+            [index_key, conference_key, speaker_key])
 
         # Getting the required data and adding it to the announcement
-        if sessions.count() > 1:
-            conference = conference_key.get()
-            speaker = speaker_key.get()
-            sessions_names = ', '.join([x.name for x in sessions])
-            if speaker:
-                announcement = FEATURED_SPEAKER_ANNOUNCEMENT % (
-                    conference.name,
-                    speaker.name,
-                    sessions_names)
-                memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, announcement)
-            else:
-                announcement = ""
-                memcache.delete(MEMCACHE_FEATURED_SPEAKER_KEY)
+        if index and index.count > 1 and conference and speaker:
+            announcement = FEATURED_SPEAKER_ANNOUNCEMENT % (
+                conference.name,
+                speaker.name,
+                ', '.join(index.sessionNames))
+            memcache.set_multi({
+                MEMCACHE_CONF_FEATURED_SPEAKER_KEY % conference_key.urlsafe():
+                    announcement,
+                MEMCACHE_FEATURED_SPEAKER_KEY: announcement})
+
+    @staticmethod
+    def _schedule_featured_speakers(conference_websafekey, speakers):
+        """Queue a featured speaker update per speaker of a conference.
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+        Tasks are named after the conference, the speaker and the current
+        window of FEATURED_SPEAKER_INTERVAL seconds and run at its end, so a
+        burst of new sessions for a speaker only updates it once.
+        """
+        add_named_tasks([bucketed_task(
+            'featured-speaker-%s-%s' % (conference_websafekey, speaker),
+            FEATURED_SPEAKER_INTERVAL,
+            params={'conference_key': conference_websafekey,
+                    'speaker_key': speaker},
+            url='/tasks/set_featured_speaker')
+            for speaker in speakers])
+
+    @endpoints.method(FEATURED_SPEAKER_GET_REQUEST, StringMessage,
                       path='features_speaker_announcement/get',
                       http_method='GET',
                       name='getFeaturedSpeaker')
+    @instrument
     def get_featured_speaker(self, request):
-        """Return Announcement from memcache."""
-        return StringMessage(
-            data=memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY) or "")
+        """Return Announcement from memcache, for a given conference if a
+        websafeConferenceKey is passed, otherwise the latest one.
+        """
+        if request.websafeConferenceKey:
+            c_key = self._get_conference_key(request.websafeConferenceKey)
+            key = MEMCACHE_CONF_FEATURED_SPEAKER_KEY % c_key.urlsafe()
+        else:
+            key = MEMCACHE_FEATURED_SPEAKER_KEY
+        return StringMessage(data=memcache.get(key) or "")
 
 
 api = endpoints.api_server([ConferenceApi])  # register API
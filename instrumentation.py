@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""instrumentation.py
+
+Per-endpoint latency and RPC instrumentation.
+
+@instrument wraps ConferenceApi methods and InstrumentedHandler wraps the
+webapp2 handlers in main.py. Each call records its wall time, the datastore
+and memcache RPCs it made and the entities it read and wrote; the counts
+come from an apiproxy post-call hook. Calls slower than
+SLOW_REQUEST_THRESHOLD_MS are logged as one structured JSON record, and every
+call is added to per-method counters in memcache, bucketed in windows of
+STATS_WINDOW_SECONDS, which the /admin/stats handler reads back.
+
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+
+import webapp2
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+from settings import SLOW_REQUEST_THRESHOLD_MS
+from settings import STATS_WINDOW_SECONDS
+from settings import STATS_WINDOWS
+
+STATS_NAMESPACE = 'stats'
+MEMCACHE_STAT_KEY = "%d %s %s"
+METRICS = ('calls', 'slow', 'wall_ms', 'datastore_rpcs', 'memcache_rpcs',
+           'entities_read', 'entities_written')
+
+# names of every instrumented method or handler in this process
+instrumented_names = set()
+
+# records of the calls in progress on this thread, innermost last
+_local = threading.local()
+
+
+class _Record(object):
+    """_Record -- the counters of one call in progress"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.counts = dict((metric, 0) for metric in METRICS)
+        self.counts['calls'] = 1
+
+
+def _active_records():
+    if not hasattr(_local, 'records'):
+        _local.records = []
+    return _local.records
+
+
+def _rpc_hook(service, call, request, response):
+    """Count an RPC against every call in progress on this thread."""
+    records = _active_records()
+    if not records:
+        return
+    counts = {}
+    if service == 'datastore_v3':
+        counts['datastore_rpcs'] = 1
+        if call == 'Get':
+            counts['entities_read'] = sum(
+                1 for entity in response.entity_list() if entity.has_entity())
+        elif call in ('RunQuery', 'Next'):
+            counts['entities_read'] = response.result_size()
+        elif call == 'Put':
+            counts['entities_written'] = request.entity_size()
+    elif service == 'memcache':
+        counts['memcache_rpcs'] = 1
+    for record in records:
+        for metric, count in counts.items():
+            record.counts[metric] += count
+
+
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+    'instrumentation', _rpc_hook)
+
+
+def _start(name):
+    instrumented_names.add(name)
+    record = _Record(name)
+    _active_records().append(record)
+    return record
+
+
+def _finish(record):
+    """Close a record, log it when slow and add it to the rolling stats."""
+    _active_records().remove(record)
+    wall_ms = int((time.time() - record.started) * 1000)
+    record.counts['wall_ms'] = wall_ms
+    if wall_ms >= SLOW_REQUEST_THRESHOLD_MS:
+        record.counts['slow'] = 1
+        logging.warning('slow request: %s', json.dumps(
+            dict(record.counts, method=record.name)))
+
+    window = int(time.time()) // STATS_WINDOW_SECONDS
+    try:
+        memcache.offset_multi(
+            dict((MEMCACHE_STAT_KEY % (window, record.name, metric), count)
+                 for metric, count in record.counts.items() if count),
+            namespace=STATS_NAMESPACE, initial_value=0)
+    except Exception:
+        # never fail a request because its stats couldn't be recorded
+        logging.exception('could not record stats for %s', record.name)
+
+
+def instrument(func):
+    """Decorator recording the cost of every call to a ConferenceApi
+    method; goes underneath @endpoints.method.
+    """
+    instrumented_names.add(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        record = _start(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _finish(record)
+    return wrapper
+
+
+class InstrumentedHandler(webapp2.RequestHandler):
+    """InstrumentedHandler -- webapp2 handler recording its own cost"""
+
+    def dispatch(self):
+        record = _start(type(self).__name__)
+        try:
+            return super(InstrumentedHandler, self).dispatch()
+        finally:
+            _finish(record)
+
+
+def get_stats(names=None):
+    """Return the per-method totals and averages of the last STATS_WINDOWS
+    windows.
+    """
+    names = sorted(names or instrumented_names)
+    window = int(time.time()) // STATS_WINDOW_SECONDS
+    windows = range(window - STATS_WINDOWS + 1, window + 1)
+    keys = [MEMCACHE_STAT_KEY % (w, name, metric)
+            for w in windows for name in names for metric in METRICS]
+    values = memcache.get_multi(keys, namespace=STATS_NAMESPACE)
+
+    stats = {}
+    for name in names:
+        totals = dict((metric, sum(
+            values.get(MEMCACHE_STAT_KEY % (w, name, metric), 0)
+            for w in windows)) for metric in METRICS)
+        if not totals['calls']:
+            continue
+        totals['averages'] = dict(
+            (metric, float(totals[metric]) / totals['calls'])
+            for metric in METRICS if metric not in ('calls', 'slow'))
+        stats[name] = totals
+    return {'windowSeconds': STATS_WINDOW_SECONDS * STATS_WINDOWS,
+            'methods': stats}
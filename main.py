@@ -12,22 +12,66 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import csv
+import json
+import endpoints
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
+from google.appengine.api import users
+from google.appengine.ext import ndb
 from conference import ConferenceApi
+from conference import ROSTER_EXPORT_BATCH_SIZE
+from instrumentation import InstrumentedHandler
+import cache
+import catalog
+import instrumentation
+import notifications
+import search_index
+import seats
+from utils import getUserId
 
+ROSTER_COLUMNS = ('displayName', 'mainEmail', 'teeShirtSize', 'registered')
 
-class SetAnnouncementHandler(webapp2.RequestHandler):
+
+class SetAnnouncementHandler(InstrumentedHandler):
     def get(self):
         """Set Announcement in Memcache."""
+        seats.reconcile_seats_available()
+        ConferenceApi._reconcile_nearly_sold_out()
+        ConferenceApi._cache_announcement()
+        self.response.set_status(204)
+
+
+class RebuildAnnouncementHandler(InstrumentedHandler):
+    def post(self):
+        """Rebuild the announcement after nearly sold out changes."""
         ConferenceApi._cache_announcement()
+
+
+class BuildCatalogSnapshotHandler(InstrumentedHandler):
+    def get(self):
+        """Publish a new snapshot of the conference catalog."""
+        catalog.build_snapshot()
+        self.response.set_status(204)
+
+
+class SendConfirmationEmailsHandler(InstrumentedHandler):
+    def get(self):
+        """Send queued confirmation emails; run by cron as a safety net."""
+        notifications.send_queued_confirmations()
         self.response.set_status(204)
 
+    def post(self):
+        """Send queued confirmation emails shortly after they are queued."""
+        notifications.send_queued_confirmations()
+
 
-class SendConfirmationEmailHandler(webapp2.RequestHandler):
+class SendConfirmationEmailHandler(InstrumentedHandler):
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation; only drains push
+        tasks queued before confirmations moved to the pull queue.
+        """
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),  # from
@@ -39,7 +83,28 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
         )
 
 
-class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
+class SendImportSummaryHandler(InstrumentedHandler):
+    def post(self):
+        """Send one email summing up a bulk conference import."""
+        mail.send_mail(
+            'noreply@%s.appspotmail.com' % (
+                app_identity.get_application_id()),  # from
+            self.request.get('email'),  # to
+            'Your conference import has finished',  # subj
+            self.request.get('summary')  # body
+        )
+
+
+class ImportConferencesHandler(InstrumentedHandler):
+    def post(self):
+        """Import one chunk of a bulk conference import."""
+        chunk = json.loads(self.request.body)
+        ConferenceApi._import_conference_chunk(
+            chunk['job'], chunk['chunk'], chunk['first_row'],
+            chunk['first_id'], chunk['rows'])
+
+
+class SetFeaturedSpeakerHandler(InstrumentedHandler):
     def post(self):
         """ If a speaker talks on more than one session """
         conference_key = self.request.get('conference_key')
@@ -47,8 +112,180 @@ class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
         ConferenceApi._cache_featured_speaker(speaker_key, conference_key)
 
 
-app = webapp2.WSGIApplication([
+class UpdateOrganizerDisplayNameHandler(InstrumentedHandler):
+    def post(self):
+        """Copy an organizer's display name onto their conferences."""
+        ConferenceApi._update_organizer_display_name(
+            self.request.get('user_id'),
+            self.request.get('cursor') or None)
+
+
+class ProcessRegistrationsHandler(InstrumentedHandler):
+    def get(self):
+        """Admit queued registrations; run by cron as a safety net."""
+        ConferenceApi._process_registration_intents()
+        self.response.set_status(204)
+
+    def post(self):
+        """Admit queued registrations shortly after they are requested."""
+        ConferenceApi._process_registration_intents()
+
+
+class BackfillOrganizerDisplayNamesHandler(InstrumentedHandler):
+    def get(self):
+        """Start copying organizer names onto older conferences."""
+        ConferenceApi._backfill_organizer_display_names()
+        self.response.set_status(204)
+
+    def post(self):
+        """Backfill the next batch of conferences."""
+        ConferenceApi._backfill_organizer_display_names(
+            self.request.get('cursor') or None)
+
+
+class MigrateRegistrationsHandler(InstrumentedHandler):
+    def get(self):
+        """Start moving registrations out of the profiles."""
+        ConferenceApi._migrate_registrations()
+        self.response.set_status(204)
+
+    def post(self):
+        """Migrate the next batch of profiles."""
+        ConferenceApi._migrate_registrations(
+            self.request.get('cursor') or None)
+
+
+class MigrateWishlistsHandler(InstrumentedHandler):
+    def get(self):
+        """Start moving wishlists out of the profiles."""
+        ConferenceApi._migrate_wishlists()
+        self.response.set_status(204)
+
+    def post(self):
+        """Migrate the next batch of profiles."""
+        ConferenceApi._migrate_wishlists(self.request.get('cursor') or None)
+
+
+class IndexSpeakerSessionsHandler(InstrumentedHandler):
+    def get(self):
+        """Start linking the existing sessions to their speakers."""
+        ConferenceApi._index_speaker_sessions()
+        self.response.set_status(204)
+
+    def post(self):
+        """Index the next batch of sessions."""
+        ConferenceApi._index_speaker_sessions(
+            self.request.get('cursor') or None)
+
+
+class UpdateSearchIndexHandler(InstrumentedHandler):
+    def post(self):
+        """Bring the search documents of some entities up to date."""
+        search_index.update([ndb.Key(urlsafe=key)
+                             for key in self.request.get_all('key')])
+
+
+class ReindexSearchHandler(InstrumentedHandler):
+    def get(self):
+        """Start rebuilding the conference and session search indexes."""
+        for kind in search_index.DOCUMENTS:
+            search_index.reindex(kind)
+        self.response.set_status(204)
+
+    def post(self):
+        """Index the next batch of a kind."""
+        search_index.reindex(self.request.get('kind'),
+                             self.request.get('cursor') or None)
+
+
+class ExportRosterHandler(InstrumentedHandler):
+    def get(self):
+        """Send a conference's attendees to its organizer, either as one page
+        of JSON (format=json, with pageSize and pageToken) or as a CSV file
+        written in cursor-driven batches.
+        """
+        try:
+            c_key = ConferenceApi._get_organized_conference_key(
+                self.request.get('conference'),
+                getUserId(users.get_current_user()))
+            if self.request.get('format') == 'json':
+                page_size = ConferenceApi._get_page_size(
+                    int(self.request.get('pageSize') or 0))
+                cursor = ConferenceApi._get_cursor(
+                    self.request.get('pageToken'))
+        except endpoints.ServiceException as e:
+            self.abort(e.http_status, detail=str(e))
+        except ValueError:
+            self.abort(400, detail='pageSize must be a number.')
+
+        if self.request.get('format') == 'json':
+            items, next_cursor, more = ConferenceApi._get_roster_page(
+                c_key, page_size, cursor)
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps({
+                'items': [dict((column, getattr(item, column))
+                               for column in ROSTER_COLUMNS)
+                          for item in items],
+                'nextPageToken': (next_cursor.urlsafe()
+                                  if more and next_cursor else None)}))
+            return
+
+        self.response.headers['Content-Type'] = 'text/csv'
+        self.response.headers['Content-Disposition'] = \
+            'attachment; filename="roster.csv"'
+        writer = csv.writer(self.response.out)
+        writer.writerow(ROSTER_COLUMNS)
+        # only one batch of registrations and profiles is held at a time
+        cursor, more = None, True
+        while more:
+            items, cursor, more = ConferenceApi._get_roster_page(
+                c_key, ROSTER_EXPORT_BATCH_SIZE, cursor)
+            writer.writerows(
+                [(getattr(item, column) or u'').encode('utf-8')
+                 for column in ROSTER_COLUMNS] for item in items)
+            more = more and cursor
+
+
+class StatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Show the rolling per-method latency and RPC stats."""
+        stats = instrumentation.get_stats(
+            instrumentation.instrumented_names |
+            set(handler.__name__ for _, handler in ROUTES))
+        stats['instanceCache'] = cache.get_stats()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(stats, indent=2, sort_keys=True))
+
+
+ROUTES = [
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/build_catalog_snapshot', BuildCatalogSnapshotHandler),
+    ('/crons/process_registrations', ProcessRegistrationsHandler),
+    ('/crons/send_confirmation_emails', SendConfirmationEmailsHandler),
+    ('/tasks/set_announcement', RebuildAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
+    ('/tasks/send_confirmation_emails', SendConfirmationEmailsHandler),
+    ('/tasks/send_import_summary', SendImportSummaryHandler),
+    ('/tasks/import_conferences', ImportConferencesHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
-], debug=True)
+    ('/tasks/update_organizer_display_name',
+     UpdateOrganizerDisplayNameHandler),
+    ('/tasks/process_registrations', ProcessRegistrationsHandler),
+    ('/tasks/backfill_organizer_display_names',
+     BackfillOrganizerDisplayNamesHandler),
+    ('/tasks/migrate_registrations', MigrateRegistrationsHandler),
+    ('/tasks/migrate_wishlists', MigrateWishlistsHandler),
+    ('/tasks/index_speaker_sessions', IndexSpeakerSessionsHandler),
+    ('/tasks/update_search_index', UpdateSearchIndexHandler),
+    ('/tasks/reindex_search', ReindexSearchHandler),
+    ('/admin/reindex_search', ReindexSearchHandler),
+    ('/admin/backfill_organizer_display_names',
+     BackfillOrganizerDisplayNamesHandler),
+    ('/admin/migrate_registrations', MigrateRegistrationsHandler),
+    ('/admin/migrate_wishlists', MigrateWishlistsHandler),
+    ('/admin/index_speaker_sessions', IndexSpeakerSessionsHandler),
+    ('/admin/stats', StatsHandler),
+    ('/exports/roster', ExportRosterHandler),
+]
+
+app = webapp2.WSGIApplication(ROUTES, debug=True)
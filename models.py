@@ -47,6 +47,19 @@ class Session(ndb.Model):
     websafeSessionKey = ndb.StringProperty()
 
 
+class SpeakerSessionCount(ndb.Model):
+    """ SpeakerSessionCount -- sessions of one speaker in a conference; child
+    of the Conference, keyed by the speaker's websafe key """
+    count = ndb.IntegerProperty(default=0, indexed=False)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class SpeakerSession(ndb.Model):
+    """ SpeakerSession -- links a speaker to one of their sessions; child of
+    the session's Conference, with the session's id """
+    speaker = ndb.KeyProperty(kind='Speaker', required=True)
+
+
 class SessionForm(messages.Message):
     """ SessionForm --  Session outbound form message """
     name = messages.StringField(1)
@@ -68,9 +81,19 @@ class TypeOfSession(messages.Enum):
     Talk = 4
 
 
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- a session on a profile's wishlist, child of Profile
+    keyed by the session's websafe key"""
+    conferenceKey = ndb.KeyProperty(required=True)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
 class SessionForms(messages.Message):
     """ SessionForms -- multiple Session outbound form message """
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
 
 
 class ConflictException(endpoints.ServiceException):
@@ -83,6 +106,8 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='Not_Specified')
+    # legacy lists, moved into Registration and WishlistEntry entities by
+    # the migration tasks
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionWishList = ndb.StringProperty(repeated=True)
     organizerUserId = ndb.StringProperty()
@@ -117,6 +142,7 @@ class Conference(ndb.Model):
     name = ndb.StringProperty(required=True)
     description = ndb.StringProperty()
     organizerUserId = ndb.StringProperty()
+    organizerDisplayName = ndb.StringProperty(indexed=False)
     topics = ndb.StringProperty(repeated=True)
     city = ndb.StringProperty()
     startDate = ndb.DateProperty()
@@ -124,6 +150,17 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    seatShards = ndb.IntegerProperty(default=0)
+    # whether seatsAvailable is within the announcement's threshold, kept in
+    # step by every seat change so the announcement only reads these
+    nearlySoldOut = ndb.BooleanProperty(default=False)
+    # bumped by every change to the conference, its sessions or its seats
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class SeatShard(ndb.Model):
+    """SeatShard -- one slice of a high-demand conference's free seats"""
+    seats = ndb.IntegerProperty(default=0, indexed=False)
 
 
 class ConferenceForm(messages.Message):
@@ -140,11 +177,28 @@ class ConferenceForm(messages.Message):
     endDate = messages.StringField(10)  # DateTimeField()
     websafeKey = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    version = messages.IntegerField(13)
+    etag = messages.StringField(14)
+    notModified = messages.BooleanField(15)
 
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
+
+
+class DashboardForm(messages.Message):
+    """DashboardForm -- everything the web client shows on startup"""
+    profile = messages.MessageField(ProfileForm, 1)
+    conferencesToAttend = messages.MessageField(ConferenceForm, 2,
+                                                repeated=True)
+    wishlist = messages.MessageField(SessionForm, 3, repeated=True)
+    wishlistCount = messages.IntegerField(4)
+    announcement = messages.StringField(5)
+    featuredSpeaker = messages.StringField(6)
 
 
 class TeeShirtSize(messages.Enum):
@@ -166,6 +220,79 @@ class TeeShirtSize(messages.Enum):
     XXXL_W = 15
 
 
+class RegistrationStatus(messages.Enum):
+    """RegistrationStatus -- asynchronous registration outcome values"""
+    PENDING = 1
+    REGISTERED = 2
+    REJECTED = 3
+
+
+class Registration(ndb.Model):
+    """Registration -- a profile's seat at a conference, child of Profile
+    keyed by the conference's websafe key"""
+    # indexed, so a conference's roster is one query away
+    conferenceKey = ndb.KeyProperty(kind=Conference, required=True)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class RegistrationTicket(ndb.Model):
+    """RegistrationTicket -- queued registration intent, child of Profile"""
+    conferenceKey = ndb.StringProperty(required=True)
+    status = ndb.StringProperty(default='PENDING')
+    message = ndb.StringProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class RegistrationTicketForm(messages.Message):
+    """RegistrationTicketForm -- RegistrationTicket outbound form message"""
+    ticketId = messages.StringField(1)
+    websafeConferenceKey = messages.StringField(2)
+    status = messages.EnumField('RegistrationStatus', 3)
+    message = messages.StringField(4)
+
+
+class ImportJob(ndb.Model):
+    """ImportJob -- progress of a bulk conference import, child of Profile"""
+    status = ndb.StringProperty(default='RUNNING')
+    total = ndb.IntegerProperty(default=0)
+    chunks = ndb.IntegerProperty(default=0)
+    chunksDone = ndb.IntegerProperty(repeated=True, indexed=False)
+    imported = ndb.IntegerProperty(default=0)
+    failed = ndb.IntegerProperty(default=0)
+    errors = ndb.StringProperty(repeated=True, indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class ConferenceImportForm(messages.Message):
+    """ConferenceImportForm -- bulk conference import inbound form message"""
+    payload = messages.StringField(1, required=True)
+    format = messages.StringField(2)  # json (default) or csv
+
+
+class ImportJobForm(messages.Message):
+    """ImportJobForm -- ImportJob outbound form message"""
+    jobId = messages.StringField(1)
+    status = messages.StringField(2)
+    total = messages.IntegerField(3)
+    imported = messages.IntegerField(4)
+    failed = messages.IntegerField(5)
+    errors = messages.StringField(6, repeated=True)
+
+
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- one registrant on a conference roster"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.StringField(3)
+    registered = messages.StringField(4)  # DateTimeField()
+
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- one page of a conference roster"""
+    items = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
 class ConferenceQueryForm(messages.Message):
     """ConferenceQueryForm -- Conference query inbound form message"""
     field = messages.StringField(1)
@@ -178,3 +305,28 @@ class ConferenceQueryForms(messages.Message):
     ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message
     """
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
+
+
+class SessionQueryForm(messages.Message):
+    """SessionQueryForm -- Session query inbound form message"""
+    field = messages.StringField(1)
+    operator = messages.StringField(2)
+    value = messages.StringField(3)
+
+
+class SessionQueryForms(messages.Message):
+    """SessionQueryForms -- multiple SessionQueryForm inbound form message"""
+    filters = messages.MessageField(SessionQueryForm, 1, repeated=True)
+    websafeConferenceKey = messages.StringField(2)
+    pageSize = messages.IntegerField(3)
+    pageToken = messages.StringField(4)
+
+
+class SearchForm(messages.Message):
+    """SearchForm -- full-text search inbound form message"""
+    query = messages.StringField(1, required=True)
+    websafeConferenceKey = messages.StringField(2)
+    pageSize = messages.IntegerField(3)
+    pageToken = messages.StringField(4)
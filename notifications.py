@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""notifications.py
+
+Batched confirmation emails for new conferences.
+
+Creating a conference no longer adds a push task per email. The organizer's
+address and the conference's main fields go on the CONFIRMATION_QUEUE pull
+queue as a small JSON payload, and a named task, one per KICK_INTERVAL,
+starts a worker soon after. The worker leases the queued emails in batches,
+groups them by organizer and sends each organizer a single email listing
+all of their new conferences. A failed send is retried with exponential
+backoff, by extending the lease of its tasks, and dropped after MAX_RETRIES
+attempts; a cron job picks up whatever the kicks leave behind.
+
+"""
+
+import json
+import logging
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import taskqueue
+
+from utils import add_bucketed_task
+
+CONFIRMATION_QUEUE = 'confirmation-emails'
+WORKER_URL = '/tasks/send_confirmation_emails'
+KICK_INTERVAL = 10  # seconds
+LEASE_SECONDS = 60
+LEASE_SIZE = 100
+LEASE_ROUNDS = 10
+MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 60  # doubled on every retry
+MAX_BACKOFF_SECONDS = 3600
+
+SUBJECT = 'You created a new Conference!'
+SUBJECT_MANY = 'You created %d new conferences!'
+BODY_TPL = u'Hi, you have created the following conference%s:\r\n\r\n%s'
+LINE_TPL = (u'%(name)s, %(city)s, %(startDate)s to %(endDate)s, '
+            u'%(maxAttendees)d seats')
+
+
+def queue_confirmation(email, conf_form):
+    """Queue the confirmation email for a new conference and make sure a
+    worker runs soon.
+    """
+    params = {
+        'email': email,
+        'name': conf_form.name,
+        'city': conf_form.city or '',
+        'startDate': (conf_form.startDate or 'TBA')[:10],
+        'endDate': (conf_form.endDate or 'TBA')[:10],
+        'maxAttendees': conf_form.maxAttendees or 0,
+    }
+    taskqueue.Queue(CONFIRMATION_QUEUE).add(
+        taskqueue.Task(payload=json.dumps(params), method='PULL'))
+
+    # a burst of new conferences only schedules one worker run
+    add_bucketed_task('send-confirmations', KICK_INTERVAL, url=WORKER_URL)
+
+
+def _render(conferences):
+    """Return (subject, body) of the email confirming these conferences."""
+    subject = SUBJECT if len(conferences) == 1 \
+        else SUBJECT_MANY % len(conferences)
+    body = BODY_TPL % ('' if len(conferences) == 1 else 's',
+                       u'\r\n'.join(LINE_TPL % conf for conf in conferences))
+    return subject, body
+
+
+def _backoff(task):
+    """Seconds to wait before the next attempt at a task."""
+    return min(RETRY_BACKOFF_SECONDS * 2 ** task.retry_count,
+               MAX_BACKOFF_SECONDS)
+
+
+def send_queued_confirmations():
+    """Lease queued confirmation emails in batches and send one email per
+    organizer in each batch.
+    """
+    queue = taskqueue.Queue(CONFIRMATION_QUEUE)
+    sender = 'noreply@%s.appspotmail.com' % (
+        app_identity.get_application_id())
+    for _ in range(LEASE_ROUNDS):
+        tasks = queue.lease_tasks(LEASE_SECONDS, LEASE_SIZE)
+        if not tasks:
+            break
+        by_email = {}
+        for task in tasks:
+            params = json.loads(task.payload)
+            by_email.setdefault(params['email'], []).append((task, params))
+
+        done = []
+        for email, batch in by_email.items():
+            subject, body = _render([params for _, params in batch])
+            try:
+                mail.send_mail(sender, email, subject, body)
+            except Exception:
+                logging.exception('could not send confirmation to %s', email)
+                for task, _ in batch:
+                    if task.retry_count >= MAX_RETRIES:
+                        logging.error('dropping confirmation to %s after '
+                                      '%d attempts', email, task.retry_count)
+                        done.append(task)
+                    else:
+                        # keep the task leased until it is due again
+                        queue.modify_task_lease(task, _backoff(task))
+                continue
+            done.extend(task for task, _ in batch)
+        if done:
+            queue.delete_tasks(done)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""query_planner.py
+
+A small query planner for user supplied filters.
+
+The datastore only serves a filter combination when a composite index
+exists for it, and only allows inequality filters on a single property. The
+planner therefore sends the filters of just one property to the datastore,
+the most selective one that has an index, and applies all the other filters
+in-process while streaming the results. Scans are capped by a budget so a
+weak primary filter can't turn into a full table scan; a page cut short by
+the budget still carries a cursor to continue from.
+
+Filters are dicts with "field", "operator" (one of the OPERATORS symbols)
+and "value" keys, as produced by ConferenceApi._format_filters().
+
+"""
+
+import operator
+
+from google.appengine.ext import ndb
+
+SCAN_BUDGET = 1000
+SCAN_BATCH_SIZE = 100
+
+COMPARATORS = {
+    '=': operator.eq,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '!=': operator.ne,
+}
+RANGE_OPERATORS = ('<', '<=', '>', '>=')
+
+
+def matches_values(values, filtr):
+    """Evaluate a filter against a property's value(s), with datastore
+    semantics: a repeated property matches if any of its values does, and a
+    missing (None) value never matches a range filter.
+    """
+    if not isinstance(values, list):
+        values = [values]
+    if filtr["operator"] in RANGE_OPERATORS:
+        values = [value for value in values if value is not None]
+    compare = COMPARATORS[filtr["operator"]]
+    return any(compare(value, filtr["value"]) for value in values)
+
+
+def matches(entity, filtr):
+    """Evaluate a filter against an entity; see matches_values()."""
+    return matches_values(getattr(entity, filtr["field"], None), filtr)
+
+
+def _cost(field, filters, selectivity):
+    """Sort key of a candidate primary field, lowest is best: equality
+    filters beat range filters, then the field's rank in `selectivity`.
+    """
+    has_equality = any(f["operator"] == '=' for f in filters)
+    return (0 if has_equality else 1, selectivity.index(field))
+
+
+def plan(query, filters, selectivity, order):
+    """Split filters into the datastore query and in-process predicates.
+
+    `selectivity` lists the filterable fields from most to least selective;
+    each needs a composite index on (field, order). `order` is the property
+    results are sorted by. Filters go through the model's properties, so
+    values such as dates and times are stored the way the datastore expects.
+    Returns (query, residual filters).
+    """
+    model = ndb.Model._lookup_model(query.kind)
+    by_field = {}
+    for filtr in filters:
+        # != runs as several merged queries that can't take cursors, so it
+        # is always applied in-process
+        if filtr["operator"] != '!=' and filtr["field"] in selectivity:
+            by_field.setdefault(filtr["field"], []).append(filtr)
+
+    primary = None
+    if by_field:
+        primary = min(by_field, key=lambda field: _cost(
+            field, by_field[field], selectivity))
+        primary_filters = by_field[primary]
+        # an inequality filter has to be the first sort order
+        prop = getattr(model, primary)
+        if any(f["operator"] != '=' for f in primary_filters):
+            query = query.order(prop)
+        for filtr in primary_filters:
+            query = query.filter(
+                COMPARATORS[filtr["operator"]](prop, filtr["value"]))
+    query = query.order(order)
+
+    residual = [filtr for filtr in filters
+                if primary is None or filtr not in by_field[primary]]
+    return query, residual
+
+
+def fetch_page(query, residual, page_size, start_cursor=None,
+               scan_budget=SCAN_BUDGET):
+    """Return (results, next cursor, more) like Query.fetch_page(), keeping
+    only entities that match every residual filter and scanning at most
+    `scan_budget` entities.
+    """
+    if not residual:
+        return query.fetch_page(page_size, start_cursor=start_cursor)
+
+    results = []
+    scanned = 0
+    it = query.iter(start_cursor=start_cursor, produce_cursors=True,
+                    batch_size=min(scan_budget, SCAN_BATCH_SIZE))
+    for entity in it:
+        scanned += 1
+        if all(matches(entity, filtr) for filtr in residual):
+            results.append(entity)
+        if len(results) == page_size or scanned >= scan_budget:
+            return results, it.cursor_after(), it.has_next()
+    return results, None, False
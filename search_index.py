@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""search_index.py
+
+Full-text search over conferences and sessions with the Search API.
+
+Every Conference and Session has a document in a search index, keyed by the
+entity's websafe key. Writes don't touch the index directly: they schedule
+a task that reads the entity back and rewrites (or deletes) its document,
+so the index follows the datastore without slowing down the API calls.
+Searches return ranked entity keys; the entities themselves are read from
+the datastore.
+
+"""
+
+from google.appengine.api import search
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+CONFERENCE_INDEX = 'conferences'
+SESSION_INDEX = 'sessions'
+INDEX_BATCH_SIZE = 200  # most documents the Search API takes per call
+UPDATE_TASK_URL = '/tasks/update_search_index'
+REINDEX_TASK_URL = '/tasks/reindex_search'
+
+
+def _conference_document(conf):
+    fields = [
+        search.TextField(name='name', value=conf.name),
+        search.TextField(name='description', value=conf.description),
+        search.TextField(name='organizer', value=conf.organizerDisplayName),
+        search.AtomField(name='city', value=conf.city),
+        search.NumberField(name='month', value=conf.month or 0),
+        search.NumberField(name='maxAttendees', value=conf.maxAttendees or 0),
+    ]
+    fields.extend(search.AtomField(name='topic', value=topic)
+                  for topic in conf.topics)
+    if conf.startDate:
+        fields.append(search.DateField(name='startDate',
+                                       value=conf.startDate))
+    return search.Document(doc_id=conf.key.urlsafe(), fields=fields)
+
+
+def _session_document(sess):
+    fields = [
+        search.TextField(name='name', value=sess.name),
+        search.TextField(name='highlights', value=sess.highlights),
+        search.AtomField(name='typeOfSession', value=sess.typeOfSession),
+        search.AtomField(name='conference', value=sess.key.parent().urlsafe()),
+        search.AtomField(name='speaker', value=sess.speakerKey),
+        search.NumberField(name='duration', value=sess.duration or 0),
+        search.DateField(name='date', value=sess.date),
+    ]
+    return search.Document(doc_id=sess.key.urlsafe(), fields=fields)
+
+
+# kind -> (index name, document builder)
+DOCUMENTS = {
+    'Conference': (CONFERENCE_INDEX, _conference_document),
+    'Session': (SESSION_INDEX, _session_document),
+}
+
+
+def schedule_update(key, transactional=False):
+    """Queue a task that brings the entity's search document up to date."""
+    schedule_updates([key], transactional=transactional)
+
+
+def schedule_updates(keys, transactional=False):
+    """Queue one task that brings the documents of several entities up to
+    date.
+    """
+    taskqueue.add(params={'key': [key.urlsafe() for key in keys]},
+                  url=UPDATE_TASK_URL, transactional=transactional)
+
+
+def update(keys):
+    """Rewrite the documents of the given entities; entities that no longer
+    exist have their documents deleted.
+    """
+    puts = {}
+    deletes = {}
+    for key, entity in zip(keys, ndb.get_multi(keys)):
+        index_name, build = DOCUMENTS[key.kind()]
+        if entity:
+            puts.setdefault(index_name, []).append(build(entity))
+        else:
+            deletes.setdefault(index_name, []).append(key.urlsafe())
+    for index_name, documents in puts.items():
+        index = search.Index(name=index_name)
+        for i in range(0, len(documents), INDEX_BATCH_SIZE):
+            index.put(documents[i:i + INDEX_BATCH_SIZE])
+    for index_name, doc_ids in deletes.items():
+        index = search.Index(name=index_name)
+        for i in range(0, len(doc_ids), INDEX_BATCH_SIZE):
+            index.delete(doc_ids[i:i + INDEX_BATCH_SIZE])
+
+
+def reindex(kind, websafe_cursor=None):
+    """Index one batch of every entity of a kind and chain a task for the
+    next batch; used to backfill the indexes.
+    """
+    cursor = ndb.Cursor(urlsafe=websafe_cursor) if websafe_cursor else None
+    keys, next_cursor, more = ndb.Query(kind=kind).fetch_page(
+        INDEX_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+    update(keys)
+    if more and next_cursor:
+        taskqueue.add(params={'kind': kind, 'cursor': next_cursor.urlsafe()},
+                      url=REINDEX_TASK_URL)
+
+
+def search_keys(index_name, query_string, page_size, websafe_cursor=None):
+    """Run a ranked search; return (entity keys, next page cursor).
+
+    Raises search.QueryError for malformed queries and ValueError for a bad
+    cursor.
+    """
+    options = search.QueryOptions(
+        limit=page_size,
+        ids_only=True,
+        cursor=search.Cursor(web_safe_string=websafe_cursor)
+        if websafe_cursor else search.Cursor(),
+        sort_options=search.SortOptions(
+            match_scorer=search.MatchScorer(),
+            expressions=[search.SortExpression(
+                expression='_score',
+                direction=search.SortExpression.DESCENDING,
+                default_value=0)]))
+    results = search.Index(name=index_name).search(
+        search.Query(query_string=query_string, options=options))
+    next_cursor = results.cursor.web_safe_string if results.cursor else None
+    return [ndb.Key(urlsafe=doc.doc_id) for doc in results], next_cursor
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""seats.py
+
+Sharded seat counters for high-demand conferences.
+
+A conference with at least SHARDED_SEATS_THRESHOLD seats gets its free seats
+split over SEAT_SHARD_COUNT root SeatShard entities. Registrations take a
+seat from a randomly picked shard, so concurrent registrants write to
+different entity groups instead of all contending on the Conference.
+
+"""
+
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from models import Conference
+from models import SeatShard
+
+SHARDED_SEATS_THRESHOLD = 1000
+SEAT_SHARD_COUNT = 20
+MEMCACHE_SEATS_KEY = "SEATS_AVAILABLE %s"
+SEATS_CACHE_TIME = 30  # seconds
+
+
+def shard_keys(c_key, num_shards):
+    """Return the keys of all the seat shards of a conference."""
+    wsck = c_key.urlsafe()
+    return [ndb.Key(SeatShard, '%s-%d' % (wsck, i))
+            for i in range(num_shards)]
+
+
+def shard_count_for(seats):
+    """Return how many shards a conference with this many seats gets."""
+    if seats >= SHARDED_SEATS_THRESHOLD:
+        return SEAT_SHARD_COUNT
+    return 0
+
+
+def create_shards(c_key, seats, num_shards):
+    """Spread the seats of a new conference evenly over its shards."""
+    per_shard, extra = divmod(seats, num_shards)
+    ndb.put_multi([
+        SeatShard(key=key, seats=per_shard + (1 if i < extra else 0))
+        for i, key in enumerate(shard_keys(c_key, num_shards))])
+
+
+def _invalidate(c_key):
+    """Drop the cached seat count once the surrounding transaction commits."""
+    ndb.get_context().call_on_commit(
+        lambda: memcache.delete(MEMCACHE_SEATS_KEY % c_key.urlsafe()))
+
+
+def reserve_seat(conf):
+    """Take one seat from a random non-empty shard.
+
+    Must run inside a cross-group transaction. A seat is only taken from a
+    shard that still has one, so the conference is never oversold. Returns
+    False when every shard is empty.
+    """
+    return take_seats(conf, 1) == 1
+
+
+def take_seats(conf, wanted):
+    """Take up to `wanted` seats from the shards, in random order.
+
+    Must run inside a cross-group transaction; only reads as many shards as
+    it needs. Returns the number of seats actually taken.
+    """
+    keys = shard_keys(conf.key, conf.seatShards)
+    random.shuffle(keys)
+    taken = 0
+    for key in keys:
+        if taken == wanted:
+            break
+        shard = key.get()
+        if shard and shard.seats > 0:
+            count = min(shard.seats, wanted - taken)
+            shard.seats -= count
+            shard.put()
+            taken += count
+    if taken:
+        _invalidate(conf.key)
+    return taken
+
+
+def release_seat(conf):
+    """Give one seat back to a random shard; must run in a transaction."""
+    key = random.choice(shard_keys(conf.key, conf.seatShards))
+    shard = key.get() or SeatShard(key=key)
+    shard.seats += 1
+    shard.put()
+    _invalidate(conf.key)
+
+
+def get_seats_available(conf):
+    """Return the free seats of a conference, summing shards if needed."""
+    if not conf.seatShards:
+        return conf.seatsAvailable
+    cache_key = MEMCACHE_SEATS_KEY % conf.key.urlsafe()
+    seats = memcache.get(cache_key)
+    if seats is None:
+        seats = sum(shard.seats for shard in
+                    ndb.get_multi(shard_keys(conf.key, conf.seatShards))
+                    if shard)
+        memcache.set(cache_key, seats, time=SEATS_CACHE_TIME)
+    return seats
+
+
+def reconcile_seats_available():
+    """Copy the summed shard counts back onto Conference.seatsAvailable so
+    that datastore queries on seatsAvailable stay roughly accurate.
+    """
+    for conf in Conference.query(Conference.seatShards > 0):
+        seats = get_seats_available(conf)
+        if conf.seatsAvailable != seats:
+            _set_seats_available(conf.key, seats)
+
+
+@ndb.transactional()
+def _set_seats_available(c_key, seats):
+    """Copy a summed seat count onto a freshly read conference, so that
+    concurrent edits to its other fields are kept.
+    """
+    conf = c_key.get()
+    if conf and conf.seatsAvailable != seats:
+        conf.seatsAvailable = seats
+        conf.put()
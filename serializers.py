@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""serializers.py
+
+Precompiled model-to-form serializers.
+
+The field-copy plan of every (model, message) pair is worked out once, when
+this module is imported, instead of walking all_fields() and probing every
+entity with hasattr()/getattr() and string checks on each call. Copying an
+entity is then a straight loop over (field name, getter) pairs.
+
+"""
+
+from operator import attrgetter
+
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import ProfileForm
+from models import Session
+from models import SessionForm
+from models import Speaker
+from models import SpeakerForm
+from models import TeeShirtSize
+from models import TypeOfSession
+
+# (model class, message class) -> Serializer
+_registry = {}
+
+
+class Serializer(object):
+    """Serializer -- copies one ndb model onto one ProtoRPC message"""
+
+    def __init__(self, model_class, message_type, converters=None):
+        converters = converters or {}
+        self.message_type = message_type
+        # message fields with a converter use it; fields that exist on the
+        # model are copied as is; anything else is left unset
+        self.plan = []
+        for field in message_type.all_fields():
+            if field.name in converters:
+                self.plan.append((field.name, converters[field.name]))
+            elif field.name in model_class._properties:
+                self.plan.append((field.name, attrgetter(field.name)))
+        # none of our outbound forms have required fields, so only pay for
+        # check_initialized() when a message type actually needs it
+        self.check = any(field.required
+                         for field in message_type.all_fields())
+
+    def to_form(self, entity):
+        """Copy an entity into a new message."""
+        form = self.message_type()
+        for name, getter in self.plan:
+            setattr(form, name, getter(entity))
+        if self.check:
+            form.check_initialized()
+        return form
+
+    def to_forms(self, entities):
+        """Copy a list of entities into a list of messages."""
+        to_form = self.to_form
+        return [to_form(entity) for entity in entities]
+
+
+def register(model_class, message_type, converters=None):
+    """Build and register the serializer for a (model, message) pair."""
+    serializer = Serializer(model_class, message_type, converters)
+    _registry[(model_class, message_type)] = serializer
+    return serializer
+
+
+def to_form(entity, message_type):
+    """Copy an entity into a new message of the given type."""
+    return _registry[(type(entity), message_type)].to_form(entity)
+
+
+def to_forms(entities, message_type, model_class=None):
+    """Copy a list of entities of one kind into messages of the given type."""
+    entities = list(entities)
+    if not entities:
+        return []
+    model_class = model_class or type(entities[0])
+    return _registry[(model_class, message_type)].to_forms(entities)
+
+
+# - - - - Converters - - - - - - - - - - - - - - - - - - - - - - - - -
+def _websafe_key(entity):
+    return entity.key.urlsafe()
+
+
+def _as_string(name):
+    """Copy the property as a string (dates and times)."""
+    getter = attrgetter(name)
+    return lambda entity: str(getter(entity))
+
+
+def _as_enum(name, enum_type):
+    """Copy a string property as the enum value of the same name."""
+    getter = attrgetter(name)
+    values = dict((value.name, value) for value in enum_type)
+    return lambda entity: values[getter(entity)]
+
+
+# - - - - Registry - - - - - - - - - - - - - - - - - - - - - - - - - -
+register(Conference, ConferenceForm, {
+    'startDate': _as_string('startDate'),
+    'endDate': _as_string('endDate'),
+    'websafeKey': _websafe_key,
+})
+
+register(Session, SessionForm, {
+    'date': _as_string('date'),
+    'startTime': _as_string('startTime'),
+    'typeOfSession': _as_enum('typeOfSession', TypeOfSession),
+    'websafeSessionKey': _websafe_key,
+})
+
+register(Profile, ProfileForm, {
+    'teeShirtSize': _as_enum('teeShirtSize', TeeShirtSize),
+})
+
+register(Speaker, SpeakerForm, {
+    'websafeKey': _websafe_key,
+})
@@ -16,3 +16,10 @@ WEB_CLIENT_ID = '379922243101-e2h0a8s3v24nk5pfabtvjitm5ve6e0go.apps.googleuserco
 ANDROID_CLIENT_ID = ''
 IOS_CLIENT_ID = ''
 ANDROID_AUDIENCE = WEB_CLIENT_ID
+
+# Requests taking longer than this are logged as slow; per-method stats are
+# kept in memcache in windows of STATS_WINDOW_SECONDS, and /admin/stats
+# reports the last STATS_WINDOWS of them.
+SLOW_REQUEST_THRESHOLD_MS = 1000
+STATS_WINDOW_SECONDS = 60
+STATS_WINDOWS = 15
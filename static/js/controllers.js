@@ -424,11 +424,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     };
 
     /**
-     * Invokes the conference.query_conferences API.
+     * Invokes the conference.query_conferences API, following nextPageToken until every matching
+     * conference has been loaded; the page shows them with its own pagination.
      */
     $scope.queryConferencesAll = function () {
         var sendFilters = {
-            filters: []
+            filters: [],
+            pageSize: 100
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -440,32 +442,49 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                 });
             }
         }
-        $scope.loading = true;
-        gapi.client.conference.queryConferences(sendFilters).
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query conferences : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters);
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
-
-                        $scope.conferences = [];
+        var conferences = [];
+        var queryPage = function (pageToken) {
+            var request = angular.extend({}, sendFilters);
+            if (pageToken) {
+                request.pageToken = pageToken;
+            }
+            gapi.client.conference.queryConferences(request).
+                execute(function (resp) {
+                    if (!resp.error && resp.nextPageToken) {
+                        // Collect this page and fetch the next one.
                         angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
+                            conferences.push(conference);
                         });
+                        queryPage(resp.nextPageToken);
+                        return;
                     }
-                    $scope.submitted = true;
+                    $scope.$apply(function () {
+                        $scope.loading = false;
+                        if (resp.error) {
+                            // The request has failed.
+                            var errorMessage = resp.error.message || '';
+                            $scope.messages = 'Failed to query conferences : ' + errorMessage;
+                            $scope.alertStatus = 'warning';
+                            $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
+                        } else {
+                            // The request has succeeded.
+                            $scope.submitted = false;
+                            $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters);
+                            $scope.alertStatus = 'success';
+                            $log.info($scope.messages);
+
+                            angular.forEach(resp.items, function (conference) {
+                                conferences.push(conference);
+                            });
+                            $scope.conferences = conferences;
+                            $scope.pagination.currentPage = 0;
+                        }
+                        $scope.submitted = true;
+                    });
                 });
-            });
+        };
+        $scope.loading = true;
+        queryPage(null);
     }
 
     /**
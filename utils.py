@@ -3,9 +3,13 @@ import os
 import time
 import uuid
 
+from google.appengine.api import taskqueue
 from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
 from models import Profile
 
+MAX_TASKS_PER_ADD = 100
+
 def getUserId(user, id_type="email"):
     if id_type == "email":
         return user.email()
@@ -43,3 +47,48 @@ def getUserId(user, id_type="email"):
             return profile.id()
         else:
             return str(uuid.uuid1().get_hex())
+
+
+def bucketed_task(name, interval, **kwargs):
+    """Return a task named after the current window of interval seconds
+    and due at its end, so that a burst of calls within one window shares
+    a single task.
+    """
+    now = time.time()
+    window = int(now) // interval
+    return taskqueue.Task(name='%s-%d' % (name, window),
+                          countdown=(window + 1) * interval - now, **kwargs)
+
+
+def add_named_tasks(tasks, queue_name='default'):
+    """Add named tasks, skipping those that already exist."""
+    queue = taskqueue.Queue(queue_name)
+    # tasks that already exist are reported, the others are still added
+    for i in range(0, len(tasks), MAX_TASKS_PER_ADD):
+        try:
+            queue.add(tasks[i:i + MAX_TASKS_PER_ADD])
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+
+def fetch_batch(query, batch_size, websafe_cursor=None, **options):
+    """Fetch one batch of a query, starting at a websafe cursor; returns the
+    results and the websafe cursor of the next batch, None after the last.
+    """
+    cursor = ndb.Cursor(urlsafe=websafe_cursor) if websafe_cursor else None
+    results, next_cursor, more = query.fetch_page(
+        batch_size, start_cursor=cursor, **options)
+    return results, next_cursor.urlsafe() if more and next_cursor else None
+
+
+def chain_batch(url, websafe_cursor, **params):
+    """Queue the task that handles the next batch, if there is one."""
+    if websafe_cursor:
+        params['cursor'] = websafe_cursor
+        taskqueue.add(params=params, url=url)
+
+
+def add_bucketed_task(name, interval, **kwargs):
+    """Add the task of the current window, unless it already exists."""
+    add_named_tasks([bucketed_task(name, interval, **kwargs)])